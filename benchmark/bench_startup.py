@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+导入时间和启动时间的基准测试
+
+每个模块在新的Python进程中导入，测得扣除numpy导入时间后的额外耗时，并检查导入后
+是否加载了图形界面或绘图库。任一模块超出时间预算或加载了禁止的库时，返回值为1。
+
+用法（在仓库根目录下）：
+    python benchmark/bench_startup.py [--repeat 5] [--budget-ms 60] [--json out.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+MICROVIEW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'microview')
+
+# 数值计算模块：只允许依赖numpy
+NUMERIC_MODULES = ['mv2d.mv_data2d', 'mv2d.mv_2dcreator', 'mv2d.mv_2dparameter', 'mv2d.mv_fractal',
+                   'mv2d.mv_accumulator', 'mv2d.mv_datafile', 'mv2d.mv_import', 'mv2d.mv_trace',
+                   'mv2d.mv_progress', 'mv3d.mv_3dcreator', 'mv3d.mv_3dparameter', 'mv3d.mv_3dtiled',
+                   'mv3d.mv_pyramid', 'mv_batch']
+GUI_MODULES = ['mv2d.mv_frac_prof_gui', 'mv3d.mv_frac_surf_gui']
+FORBIDDEN = ('matplotlib', 'mpl_toolkits', 'PySide2', 'scipy')
+IMPORT_BUDGET_MS = 60   # 扣除numpy后每个数值计算模块的导入时间上限（毫秒）
+
+_PROBE = '''
+import sys, time, json
+t0 = time.perf_counter()
+import numpy
+t1 = time.perf_counter()
+import {module}
+t2 = time.perf_counter()
+loaded = sorted({{m.split('.')[0] for m in sys.modules}} & set({forbidden!r}))
+print(json.dumps({{'numpy_ms': (t1 - t0) * 1e3, 'module_ms': (t2 - t1) * 1e3, 'forbidden': loaded}}))
+'''
+
+
+def probe_import(module, repeat):
+    """ 在新进程中导入module，重复repeat次取最短时间
+
+    :return: dict，numpy_ms、module_ms为numpy及模块本身的导入时间，forbidden为加载的禁止库
+    """
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, forbidden=FORBIDDEN)],
+                             cwd=MICROVIEW_DIR, capture_output=True, text=True)
+        if out.returncode != 0:
+            return {'error': out.stderr.strip().splitlines()[-1]}
+        res = json.loads(out.stdout)
+        if best is None or res['module_ms'] < best['module_ms']:
+            best = res
+    return best
+
+
+def probe_cli(repeat):
+    """ 命令行工具打印帮助信息的进程总耗时（毫秒），重复repeat次取最短时间 """
+    best = None
+    for _ in range(repeat):
+        t_beg = time.perf_counter()
+        subprocess.run([sys.executable, 'mv_batch.py', '--help'], cwd=MICROVIEW_DIR, capture_output=True)
+        t = (time.perf_counter() - t_beg) * 1e3
+        best = t if best is None else min(best, t)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="microview导入时间基准测试")
+    parser.add_argument('--repeat', type=int, default=5, help="每个模块的导入次数")
+    parser.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS, help="数值计算模块的导入时间上限")
+    parser.add_argument('--json', default=None, help="把结果写入json文件")
+    args = parser.parse_args(argv)
+
+    results = {'numeric': {}, 'gui': {}}
+    failed = False
+    print('{:<24}{:>10}{:>10}  {}'.format('module', 'import', 'numpy', 'status'))
+    for module in NUMERIC_MODULES:
+        res = probe_import(module, args.repeat)
+        results['numeric'][module] = res
+        if 'error' in res:
+            status = 'ERROR ' + res['error']
+        elif res['forbidden']:
+            status = 'FAIL 加载了' + ','.join(res['forbidden'])
+        elif res['module_ms'] > args.budget_ms:
+            status = 'FAIL 超出{:.0f} ms'.format(args.budget_ms)
+        else:
+            status = 'ok'
+        failed = failed or status != 'ok'
+        print('{:<24}{:>8.1f}ms{:>8.1f}ms  {}'.format(module, res.get('module_ms', float('nan')),
+                                                     res.get('numpy_ms', float('nan')), status))
+
+    # 图形界面模块只报告导入时间，缺少PySide2时跳过
+    for module in GUI_MODULES:
+        res = probe_import(module, 1)
+        results['gui'][module] = res
+        if 'error' in res:
+            print('{:<24}{:>10}{:>10}  skipped ({})'.format(module, '-', '-', res['error']))
+        else:
+            print('{:<24}{:>8.1f}ms{:>8.1f}ms  info'.format(module, res['module_ms'], res['numpy_ms']))
+
+    results['cli_help_ms'] = probe_cli(args.repeat)
+    print('{:<24}{:>8.1f}ms'.format('mv_batch --help', results['cli_help_ms']))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
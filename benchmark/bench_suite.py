@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+建模算法和表征参数的性能基准测试
+
+对每个建模方法和参数计算方法，在一组数据规模上测量运行时间（多次运行取最短）、
+峰值内存（tracemalloc统计的numpy及Python分配）和吞吐量（每秒处理的数据点数）。
+结果保存为json文件，可作为基准；与已有基准比较时，超出阈值的项目标记为回退，返回值为1。
+
+用法（在仓库根目录下）：
+    python benchmark/bench_suite.py --save benchmark/baseline.json
+    python benchmark/bench_suite.py --compare benchmark/baseline.json --threshold 0.25
+    python benchmark/bench_suite.py --filter surface.create --max-surface 1024
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'microview'))
+
+import numpy as np
+from mv2d.mv_2dcreator import Mv2dCreator
+from mv2d.mv_2dparameter import Mv2dParameter
+from mv3d.mv_3dcreator import Mv3dCreator, _get_spectrum_power_sum
+from mv3d.mv_3dparameter import Mv3dParameter
+
+PROFILE_EXPONENTS = range(6, 23, 2)     # 轮廓点数 2^6 ... 2^22
+SURFACE_SIZES = [32, 64, 128, 256, 512, 1024, 2048, 4096]
+PROFILE_D = 1.5
+SURFACE_D = 2.3
+MIN_TIME = 0.2          # 每项测试累计运行时间的下限（秒），据此确定重复次数
+MAX_REPEAT = 20
+THRESHOLD = 0.25        # 与基准相比允许的相对增加量
+TIME_SLACK = 5e-4       # 运行时间比较时忽略的绝对增加量（秒），避免亚毫秒级测试的噪声
+MEM_SLACK = 2**20       # 峰值内存比较时忽略的绝对增加量（字节）
+
+_data_cache = {}        # 参数计算测试所用的数据，每种规模只生成一次
+
+
+def _profile_data(n):
+    if ('profile', n) not in _data_cache:
+        np.random.seed(0)
+        creator = Mv2dCreator()
+        creator.create_data_dft(n, PROFILE_D, 1, 1)
+        _data_cache[('profile', n)] = creator.get_data()
+    return _data_cache[('profile', n)]
+
+
+def _surface_data(n):
+    if ('surface', n) not in _data_cache:
+        np.random.seed(0)
+        creator = Mv3dCreator()
+        creator.create_surf_dft(n, SURFACE_D, 1, 1)
+        _data_cache[('surface', n)] = creator.get_data()
+    return _data_cache[('surface', n)]
+
+
+def _creator_case(cls, method, args):
+    """ 建模方法的测试：每次运行使用新的生成器对象 """
+    def make(n):
+        return lambda: getattr(cls(), method)(*args(n))
+    return make
+
+
+def _getter_case(kind, getter, *args):
+    """ 参数计算方法的测试：每次运行使用新的参数对象，不使用缓存的中间结果 """
+    def make(n):
+        if kind == 'profile':
+            data = _profile_data(n)
+            return lambda: getattr(Mv2dParameter(data), getter)(*args)
+        data = _surface_data(n)
+        return lambda: getattr(Mv3dParameter(data), getter)(*args)
+    return make
+
+
+def _fractal_cof_case(n):
+    def run():
+        _get_spectrum_power_sum.cache_clear()   # 测量未缓存时的计算时间
+        return Mv3dCreator()._get_fractal_cof_from_sq(n, SURFACE_D, 1)
+    return run
+
+
+def build_cases(max_profile_exp, max_surface):
+    """ 返回测试项目列表，每项为(名称, 规模列表, 数据点数函数, 构造函数) """
+    p_sizes = [2**e for e in PROFILE_EXPONENTS if e <= max_profile_exp]
+    s_sizes = [n for n in SURFACE_SIZES if n <= max_surface]
+
+    def p_points(n):
+        return n
+
+    def s_points(n):
+        return n * n
+
+    cases = [
+        ('profile.create_data_wm', p_sizes, p_points,
+         _creator_case(Mv2dCreator, 'create_data_wm', lambda n: (n, PROFILE_D, 1, 1))),
+        ('profile.create_data_dft', p_sizes, p_points,
+         _creator_case(Mv2dCreator, 'create_data_dft', lambda n: (n, PROFILE_D, 1, 1))),
+        ('profile.create_data_mpd', p_sizes, p_points,
+         _creator_case(Mv2dCreator, 'create_data_mpd', lambda n: (n, PROFILE_D, 1))),
+        ('surface.create_surf_dft', s_sizes, s_points,
+         _creator_case(Mv3dCreator, 'create_surf_dft', lambda n: (n, SURFACE_D, 1, 1))),
+        ('surface.create_surf_rmd', s_sizes, s_points,
+         _creator_case(Mv3dCreator, 'create_surf_rmd', lambda n: (n, SURFACE_D, 1, 1))),
+        ('surface._get_fractal_cof_from_sq', s_sizes, s_points, _fractal_cof_case),
+    ]
+    for name in ('Rq', 'Ra', 'Rsk', 'Rku', 'Rp', 'Rv', 'Rz', 'Rt', 'Rdq', 'Ral'):
+        cases.append(('profile.get_' + name, p_sizes, p_points, _getter_case('profile', 'get_' + name)))
+    cases.append(('profile.compute_all', p_sizes, p_points, _getter_case('profile', 'compute_all')))
+    for method in ('psd', 'variogram', 'box', 'roughness_length'):
+        cases.append(('profile.get_fractal_dimension.' + method, p_sizes, p_points,
+                      _getter_case('profile', 'get_fractal_dimension', method)))
+    for name in ('Sq', 'Sa', 'Ssk', 'Sku', 'Sp', 'Sv', 'Sz', 'Sdq', 'Sdr', 'Sal', 'Str', 'Std'):
+        cases.append(('surface.get_' + name, s_sizes, s_points, _getter_case('surface', 'get_' + name)))
+    cases.append(('surface.compute_all', s_sizes, s_points, _getter_case('surface', 'compute_all')))
+    for method in ('psd', 'variogram', 'box', 'roughness_length'):
+        cases.append(('surface.get_fractal_dimension.' + method, s_sizes, s_points,
+                      _getter_case('surface', 'get_fractal_dimension', method)))
+    return cases
+
+
+def measure(run):
+    """ 测量一项测试的运行时间和峰值内存
+
+    :return: (最短运行时间（秒）, 峰值内存（字节）)
+    """
+    t_beg = time.perf_counter()
+    run()
+    best = time.perf_counter() - t_beg
+    repeat = min(MAX_REPEAT, int(MIN_TIME / max(best, 1e-9)))
+    for _ in range(repeat):
+        t_beg = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - t_beg)
+
+    # 峰值内存单独测量，tracemalloc的开销不计入运行时间
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    run()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return best, peak
+
+
+def run_suite(cases, name_filter=None, out=sys.stdout):
+    results = {}
+    out.write('{:<44}{:>10}{:>12}{:>12}{:>14}\n'.format('case', 'size', 'time(ms)', 'peak(MB)', 'Mpts/s'))
+    for name, sizes, points, make in cases:
+        if name_filter and name_filter not in name:
+            continue
+        results[name] = {}
+        for n in sizes:
+            t, peak = measure(make(n))
+            results[name][str(n)] = {'time_s': t, 'peak_bytes': peak, 'points': points(n),
+                                     'throughput': points(n) / t}
+            out.write('{:<44}{:>10}{:>12.3f}{:>12.2f}{:>14.2f}\n'.format(
+                name, n, t * 1e3, peak / 2**20, points(n) / t / 1e6))
+            out.flush()
+    return results
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """ 与基准比较，返回回退项目列表，每项为(名称, 规模, 指标, 基准值, 当前值) """
+    regressions = []
+    for name, by_size in results.items():
+        for size, cur in by_size.items():
+            base = baseline.get('results', {}).get(name, {}).get(size)
+            if base is None:
+                continue
+            if cur['time_s'] > base['time_s'] * (1 + threshold) + TIME_SLACK:
+                regressions.append((name, size, 'time_s', base['time_s'], cur['time_s']))
+            if cur['peak_bytes'] > base['peak_bytes'] * (1 + threshold) + MEM_SLACK:
+                regressions.append((name, size, 'peak_bytes', base['peak_bytes'], cur['peak_bytes']))
+    return regressions
+
+
+def _environment():
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'processor': platform.processor(),
+            'cpu_count': os.cpu_count()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="microview性能基准测试")
+    parser.add_argument('--filter', default=None, help="只运行名称中包含该字符串的测试")
+    parser.add_argument('--max-profile-exp', type=int, default=max(PROFILE_EXPONENTS),
+                        help="轮廓点数的最大指数（2^k）")
+    parser.add_argument('--max-surface', type=int, default=max(SURFACE_SIZES), help="表面边长的最大值")
+    parser.add_argument('--save', default=None, help="把结果保存为基准json文件")
+    parser.add_argument('--compare', default=None, help="与该基准json文件比较")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help="判定回退的相对增加量")
+    args = parser.parse_args(argv)
+
+    cases = build_cases(args.max_profile_exp, args.max_surface)
+    results = run_suite(cases, args.filter)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': _environment(), 'results': results}, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, size, metric, base, cur in regressions:
+            print('REGRESSION {} n={} {}: {:.4g} -> {:.4g} (+{:.0%})'.format(
+                name, size, metric, base, cur, cur / base - 1))
+        if regressions:
+            return 1
+        print('与基准{}相比没有超过{:.0%}的回退'.format(args.compare, args.threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
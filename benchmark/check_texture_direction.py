@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+纹理方向Std的统计检查
+
+白噪声表面没有优势方向，其Std应在[0, 180)内均匀分布：对一组白噪声表面的Std做卡方检验，
+检查结果是否集中在坐标轴、对角线等网格方向上。对已知方向的正弦纹理表面，检查Std的误差。
+任一检查不通过时返回值为1。
+
+用法（在仓库根目录下）：
+    python benchmark/check_texture_direction.py [--count 400] [--size 128]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'microview'))
+
+import numpy as np
+from mv2d.mv_spatial import texture_direction
+
+NOISE_BINS = 9          # 卡方检验的分组数
+CHI2_LIMIT = 26.1       # 自由度为8、显著性水平0.001时的卡方临界值
+SINE_PERIOD = 20        # 正弦纹理的周期（采样间隔）
+SINE_TOLERANCE = 1.0    # 正弦纹理方向允许的误差（度）
+
+
+def check_noise(count, size, seed):
+    """ 白噪声表面Std的卡方统计量及各组计数 """
+    rng = np.random.RandomState(seed)
+    std = np.array([texture_direction(rng.standard_normal((size, size))) for _ in range(count)])
+    hist, _ = np.histogram(std, bins=NOISE_BINS, range=(0, 180))
+    expected = count / NOISE_BINS
+    return float(np.sum((hist - expected)**2 / expected)), hist
+
+
+def check_sine(size, seed):
+    """ 各方向正弦纹理表面Std的最大误差（度） """
+    rng = np.random.RandomState(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(float)
+    err = 0.0
+    for angle in range(0, 180, 10):
+        th = np.radians(angle)
+        z = np.sin(2 * np.pi * (x * np.cos(th) + y * np.sin(th)) / SINE_PERIOD)
+        z += 0.1 * rng.standard_normal(z.shape)
+        diff = (texture_direction(z) - (angle + 90) + 90) % 180 - 90    # 纹理方向与波矢方向垂直
+        err = max(err, abs(diff))
+    return err
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="纹理方向Std的统计检查")
+    parser.add_argument('--count', type=int, default=400, help="白噪声表面的个数")
+    parser.add_argument('--size', type=int, default=128, help="白噪声表面的边长")
+    parser.add_argument('--seed', type=int, default=0, help="随机数种子")
+    args = parser.parse_args(argv)
+
+    chi2, hist = check_noise(args.count, args.size, args.seed)
+    noise_ok = chi2 <= CHI2_LIMIT
+    print('white noise  chi2 {:.1f} (limit {:.1f})  counts {}  {}'.format(
+        chi2, CHI2_LIMIT, hist.tolist(), 'ok' if noise_ok else 'FAIL'))
+
+    err = check_sine(256, args.seed)
+    sine_ok = err <= SINE_TOLERANCE
+    print('sine texture max error {:.2f} deg (limit {:.1f})  {}'.format(
+        err, SINE_TOLERANCE, 'ok' if sine_ok else 'FAIL'))
+    return 0 if noise_ok and sine_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,149 @@
 # -*- coding: utf-8 -*-
+import functools
 import numpy as np
 from mv2d.mv_data2d import MvData2d
-import scipy
+from mv2d.mv_datafile import load_data, save_data
+from mv2d.mv_ensemble import draw_stacked, get_stream, create_ensemble
+from mv2d.mv_progress import report
+from mv2d.mv_trace import span, traced
+
+WM_MEM_BUDGET = 32 * 2**20  # W-M函数分块求和时临时数组的默认内存上限（字节）
+MPD_STREAM_CHUNKS = 2**16   # 无限生成时每组的段数
+
+
+def _wm_sum(x, freq_index, phi, d, gamma, mem_budget=WM_MEM_BUDGET, progress=None):
+    """ 在位置x处计算W-M函数的频率求和（不含尺度系数）
+
+    频率×位置的二维求和按位置分块进行，每块临时数组的大小不超过mem_budget。
+    利用cos(a+phi) = cos(a)cos(phi) - sin(a)sin(phi)，与相位无关的cos(a)、sin(a)每块只计算一次，
+    各组相位逐行与之相乘，每组的结果与同时计算的组数无关。
+
+    :param x: 一维ndarray，采样点位置
+    :param freq_index: 一维ndarray，频率索引
+    :param phi: 形状为(k, freq_index.size)的ndarray，每行为一组与freq_index对应的相位
+    :param d: 分形维数
+    :param gamma: 频率密度参数
+    :param mem_budget: 临时数组允许占用的字节数
+    :param progress: 进度回调，每块求和前调用一次，见mv2d.mv_progress
+    :return: 形状为(k, x.size)的ndarray
+    """
+    x = np.asarray(x, dtype=float)
+    freq = 2 * np.pi * np.power(gamma, freq_index.astype(float))
+    amp = 1 / np.power(gamma, (2-d) * freq_index.astype(float))
+    data = np.zeros((phi.shape[0], x.size), dtype=float)
+    if freq_index.size == 0:
+        return data
+
+    amp_cos = amp * np.cos(phi)
+    amp_sin = amp * np.sin(phi)
+    blk = max(1, int(mem_budget) // (24 * freq_index.size))  # 每块的采样点数
+    for i_beg in range(0, x.size, blk):
+        report(progress, i_beg / x.size, "W-M函数求和")
+        i_end = min(i_beg + blk, x.size)
+        arg = np.multiply.outer(freq, x[i_beg:i_end])
+        cos_arg, sin_arg = np.cos(arg), np.sin(arg)
+        # 矩阵乘法按行数选用不同的BLAS内核，舍入误差不同，故逐行计算
+        for j in range(phi.shape[0]):
+            data[j, i_beg:i_end] = np.dot(amp_cos[j], cos_arg) - np.dot(amp_sin[j], sin_arg)
+    return data
+
+
+def _profile_wm(x, freq_index, d, g, gamma, random, mem_budget, rngs, progress=None):
+    """ 用W-M函数生成分形轮廓
+
+    :param x: 一维ndarray，采样点位置
+    :param freq_index: 一维ndarray，频率索引
+    :param d: 分形维数
+    :param g: 尺度系数
+    :param gamma: 频率密度参数
+    :param random: 是否引入随机相位
+    :param mem_budget: 分块求和时临时数组允许占用的字节数
+    :param rngs: 随机源序列，每条轮廓一个
+    :param progress: 进度回调，见mv2d.mv_progress
+    :return: 形状为(len(rngs), x.size)的ndarray
+    """
+    if random:
+        # 每个频率索引一个[0, 2*np.pi)均匀分布的随机相位，按频率顺序一次性抽取
+        phi = draw_stacked(rngs, 'random_sample', size=freq_index.size) * np.pi * 2
+    else:
+        phi = np.zeros((len(rngs), freq_index.size))
+    return np.power(g, d-1) * _wm_sum(x, freq_index, phi, d, gamma, mem_budget, progress)
+
+
+def _profile_dft(n, mag, stable, rngs, progress=None):
+    """ 由幅值包络生成DFT分形轮廓
+
+    :param n: 采样点数
+    :param mag: 一维ndarray，频率索引k=1..n/2-1处的幅值
+    :param stable: 是否生成平稳分形
+    :param rngs: 随机源序列，每条轮廓一个
+    :param progress: 进度回调，每个步骤前调用一次，见mv2d.mv_progress
+    :return: 形状为(len(rngs), n)的ndarray
+    """
+    report(progress, 0.0, "抽取随机相位")
+    # 实序列的傅里叶系数满足共轭对称，只需构造k=0..n/2的半谱，再由实逆变换得到轮廓
+    if not stable:
+        mag = mag * draw_stacked(rngs, 'random_sample', size=mag.size)
+    phase = draw_stacked(rngs, 'uniform', 0, 2*np.pi, size=mag.size)
+
+    report(progress, 0.3, "填充傅里叶系数")
+    with span('_profile_dft.fill') as sp:
+        dft_cof = np.zeros((len(rngs), n//2 + 1), dtype=complex)   # 存储半谱离散傅里叶系数，k=0和k=n/2处为0
+        sp.add_bytes(dft_cof.nbytes)
+        dft_cof[:, 1:n//2].real = mag * np.cos(phase)
+        dft_cof[:, 1:n//2].imag = mag * np.sin(phase)
+
+    report(progress, 0.5, "傅里叶逆变换")
+    with span('_profile_dft.irfft') as sp:
+        data = np.fft.irfft(dft_cof, n)
+        sp.add_bytes(data.nbytes)
+    return data
+
+
+def _profile_mpd(n, d, sigma, rngs, progress=None):
+    """ 用随机中点位移法生成分形轮廓
+
+    :param n: 采样点数，n=2^{lev}
+    :param d: 分形维数
+    :param sigma: 期望的标准差
+    :param rngs: 随机源序列，每条轮廓一个
+    :param progress: 进度回调，见mv2d.mv_progress
+    :return: 形状为(len(rngs), n-1)的ndarray
+    """
+    # 计算轮廓的总点数比输入总点数多1个，后面将首尾两点去除
+    data = np.zeros((len(rngs), n+1), dtype=float)
+    data[:, n] = sigma * draw_stacked(rngs, 'standard_normal')
+    _mpd_fill(data, d, sigma, rngs, progress)
+    return data[:, 1:n]
+
+
+def _mpd_fill(data, d, sigma, rngs, progress=None):
+    """ 在首尾两点已知的条件下，用随机中点位移法逐层填充data中的其余点
+
+    :param data: 形状为(len(rngs), n+1)的ndarray，n=2^{lev}，原地修改
+    :param d: 分形维数
+    :param sigma: 期望的标准差
+    :param rngs: 随机源序列，每条轮廓一个
+    :param progress: 进度回调，每层迭代前调用一次，见mv2d.mv_progress
+    """
+    n = data.shape[1] - 1
+    hurst = 2 - d   # 计算Hurst指数
+    lev = int(np.log2(n))   # 迭代次数
+
+    mid_one = n//2   # 每次迭代时的第一个点的序号
+    d_sigma = sigma * (np.power(0.5, 2*hurst) - 0.25)
+
+    for i in range(0, lev):
+        report(progress, i / lev, "随机中点位移：第{}/{}层".format(i+1, lev))
+        # 本层所有中点（mid_one, 3*mid_one, ...）由其左右两个已知点的均值加随机位移得到，
+        # 整层一次性完成切片更新，随机数按中点顺序一次抽取
+        i_inc = 2 * mid_one
+        mid = data[:, mid_one:n:i_inc]
+        np.add(data[:, 0:n-mid_one:i_inc], data[:, i_inc:n+1:i_inc], out=mid)
+        mid *= 0.5
+        mid += np.sqrt(d_sigma) * draw_stacked(rngs, 'standard_normal', size=mid.shape[1])
+        mid_one = mid_one // 2
+        d_sigma = np.power(0.5, 2*hurst)*d_sigma
 
 
 class Mv2dCreator(object):
@@ -12,7 +154,8 @@ class Mv2dCreator(object):
     def __init__(self):
         self.data = MvData2d()
 
-    def create_data_wm(self, n: int, d: float, g: float, inter: float, random=True, gamma=1.5):
+    def create_data_wm(self, n: int, d: float, g: float, inter: float, random=True, gamma=1.5,
+                       mem_budget=WM_MEM_BUDGET, progress=None):
         """ 基于Weierstrass Mandelbrot函数生成分形数据
 
         :param n: 采样点数
@@ -21,24 +164,15 @@ class Mv2dCreator(object):
         :param inter: 采样间隔
         :param gamma
         :param random: 是否引入随机相位
+        :param mem_budget: 分块求和时临时数组允许占用的字节数
+        :param progress: 进度回调progress(fraction, stage)，抛出异常可取消建模，见mv2d.mv_progress
         """
-        data = np.zeros(n, dtype=float)
-        smp_length = inter * (n-1)
-        freq_index_min = -int((np.log(smp_length) / np.log(gamma)))
-        freq_index_max = -int((np.log(inter) / np.log(gamma)))
-        for f in range(freq_index_min, freq_index_max):
-            if random:
-                phi = np.random.rand()*np.pi*2  # [0, 2*np.pi) 均匀分布的随机相位
-            else:
-                phi = 0
-            for i in range(0, n):
-                data[i] += np.cos(2*np.pi*np.power(gamma, f)*i*inter+phi) / np.power(gamma, (2-d)*f)
-
-        data = np.power(g, d-1) * data
-        self.data.value = data
+        sampler = self._sampler_wm(n, d, g, inter, random, gamma, mem_budget)
+        self.data.value = traced('_profile_wm', sampler)([np.random], progress=progress)[0]
         self.data.interval = inter
+        self.data.set_meta(method='wm', d=d)
 
-    def create_data_dft(self, n: int, d: float, rq: float, inter: float, stable=True):
+    def create_data_dft(self, n: int, d: float, rq: float, inter: float, stable=True, progress=None):
         """ 基于离散傅里叶变换（Discrete Fourier Transform, DFT）生成分形数据
 
         :param n: 采样点数，应为2的幂次方
@@ -46,6 +180,144 @@ class Mv2dCreator(object):
         :param rq: 轮廓采样点高度均方根偏差的期望值
         :param inter: 轮廓的采样间隔，存储在轮廓数据中，DFT时不需用到。
         :param stable: 生成轮廓的实际Rq值是否等于参数rq的值
+        :param progress: 进度回调progress(fraction, stage)，抛出异常可取消建模，见mv2d.mv_progress
+        """
+        self.data.value = self._sampler_dft(n, d, rq, inter, stable)([np.random], progress=progress)[0]
+        self.data.interval = inter
+        self.data.set_meta(method='dft', d=d, target=rq)
+
+    def create_data_mpd(self, n: int, d: float, inter: float, sigma: float = 1, progress=None):
+        """ 基于随机中点位移法生成分形数据
+
+        :param n: 采样点数，n=2^{lev}，lev为迭代层数，生成的轮廓去除首尾两点后有n-1个点
+        :param d: 分形维数，1<d<2
+        :param inter: 采样间隔
+        :param sigma: 期望的标准差
+        :param progress: 进度回调progress(fraction, stage)，抛出异常可取消建模，见mv2d.mv_progress
+        """
+        sampler = self._sampler_mpd(n, d, inter, sigma)
+        self.data.value = traced('_profile_mpd', sampler)([np.random], progress=progress)[0]
+        self.data.interval = inter
+        self.data.set_meta(method='mpd', d=d)
+
+    def stream_data_wm(self, n: int, d: float, g: float, inter: float, random=True, gamma=1.5,
+                       chunk_size=2**20, mem_budget=WM_MEM_BUDGET, seed=None):
+        """ 基于W-M函数逐段生成一条n点的分形轮廓，不改变self.data
+
+        随机相位只在开始时抽取一次，每段在对应的采样位置上继续计算W-M函数，
+        各段首尾相接即为create_data_wm生成的轮廓，占用内存与n无关。
+
+        :param n: 总采样点数，决定W-M函数的最低频率
+        :param d: 分形维数，1<d<2
+        :param g: 尺度系数
+        :param inter: 采样间隔
+        :param random: 是否引入随机相位
+        :param gamma: 频率密度参数
+        :param chunk_size: 每段的采样点数
+        :param mem_budget: 分块求和时临时数组允许占用的字节数
+        :param seed: 随机数种子，为None时使用全局随机状态
+        :return: 迭代器，每次产生一段轮廓高度的一维ndarray
+        """
+        rng = np.random if seed is None else get_stream(seed)
+        smp_length = inter * (n-1)
+        freq_index_min = -int((np.log(smp_length) / np.log(gamma)))
+        freq_index_max = -int((np.log(inter) / np.log(gamma)))
+        freq_index = np.arange(freq_index_min, freq_index_max)
+        if random:
+            phi = draw_stacked([rng], 'random_sample', size=freq_index.size) * np.pi * 2
+        else:
+            phi = np.zeros((1, freq_index.size))
+
+        for i_beg in range(0, n, chunk_size):
+            x = np.arange(i_beg, min(i_beg + chunk_size, n)) * inter
+            yield np.power(g, d-1) * _wm_sum(x, freq_index, phi, d, gamma, mem_budget)[0]
+
+    def stream_data_mpd(self, n, d: float, inter: float, sigma: float = 1, chunk_size=2**16, seed=None):
+        """ 基于随机中点位移法逐段生成一条连续的分形轮廓，不改变self.data
+
+        先由随机中点位移法生成m+1个段端点（相当于整条轮廓迭代的前log2(m)层），
+        再以相邻端点为首尾，从第log2(m)层开始逐段填充段内各点（位移的标准差按层数缩小），
+        因此n给定时结果为一条n点（补足为chunk_size*m点）的随机中点位移轮廓，
+        在大于chunk_size的尺度上也保持分形维数d。内存中只有一段数据和m+1个端点。
+        n为None时每MPD_STREAM_CHUNKS段为一组，组与组之间首尾相接，
+        尺度超过chunk_size*MPD_STREAM_CHUNKS个采样点时轮廓的起伏与布朗运动（d=1.5）相同。
+
+        :param n: 总采样点数，为None时无限生成
+        :param d: 分形维数，1<d<2
+        :param inter: 采样间隔
+        :param sigma: 期望的标准差
+        :param chunk_size: 每段的采样点数，应为2的幂次方
+        :param seed: 随机数种子，为None时使用全局随机状态
+        :return: 迭代器，每次产生一段轮廓高度的一维ndarray
+        """
+        assert 1 < d < 2, "分形维数d必须满足：1<d<2"
+        assert np.log2(chunk_size).is_integer(), "每段的采样点数不是2的幂次方"
+        rngs = [np.random if seed is None else get_stream(seed)]
+        hurst = 2 - d
+
+        if n is None:
+            m = MPD_STREAM_CHUNKS
+        else:
+            m = 2**int(np.ceil(np.log2(max(1, -(-n // chunk_size)))))  # 段数，补足为2的幂次方
+        chunk_sigma = sigma * np.power(m, -2*hurst)     # 段内第一层位移相当于整条轮廓的第log2(m)层
+
+        ends = np.zeros((1, m+1), dtype=float)
+        data = np.zeros((1, chunk_size+1), dtype=float)
+        i_beg = 0
+        while n is None or i_beg < n:
+            # 新的一组段端点，起点为上一组的终点
+            ends[0, 0] = ends[0, m]
+            ends[0, m] = ends[0, 0] + sigma * rngs[0].standard_normal()
+            _mpd_fill(ends, d, sigma, rngs)
+            for j in range(m):
+                if n is not None and i_beg >= n:
+                    break
+                data[0, 0] = ends[0, j]
+                data[0, chunk_size] = ends[0, j+1]
+                _mpd_fill(data, d, chunk_sigma, rngs)
+                i_end = chunk_size if n is None else min(chunk_size, n - i_beg)
+                yield data[0, 1:i_end+1].copy()
+                i_beg += chunk_size
+
+    def create_ensemble(self, k: int, method: str, *args, chunk_size=None, seed=None, workers=None,
+                        **kwargs):
+        """ 用同一组参数一次生成k条分形轮廓，不改变self.data
+
+        与随机数无关的部分（W-M函数的频率和幅值、DFT的幅值包络）只计算一次，
+        各条轮廓的傅里叶逆变换沿第0轴批量进行。
+        给定seed或workers时，每条轮廓使用由seed派生的独立随机数流，可用进程池并行生成，
+        相同的seed在任意进程数下得到逐位相同的结果。
+
+        :param k: 轮廓条数
+        :param method: 建模算法，'wm'、'dft'或'mpd'
+        :param args: 与对应的create_data_wm、create_data_dft、create_data_mpd方法的参数相同
+        :param chunk_size: 为None时返回形状为(k, n)的ndarray；
+                           否则返回迭代器，每次产生至多chunk_size条轮廓
+        :param seed: 随机数种子，为None且workers为None时使用全局随机状态
+        :param workers: 并行生成的进程数，为None或1时在当前进程中生成
+        :param kwargs: 与对应的create_data_*方法的关键字参数相同
+        """
+        return create_ensemble(self._get_sampler(method, *args, **kwargs), k, chunk_size, seed, workers)
+
+    def _get_sampler(self, method, *args, **kwargs):
+        samplers = {'wm': self._sampler_wm, 'dft': self._sampler_dft, 'mpd': self._sampler_mpd}
+        if method not in samplers:
+            raise ValueError("未知的建模算法：{}".format(method))
+        return samplers[method](*args, **kwargs)
+
+    def _sampler_wm(self, n, d, g, inter, random=True, gamma=1.5, mem_budget=WM_MEM_BUDGET):
+        """ 返回W-M函数法的采样函数，参数同create_data_wm
+        """
+        smp_length = inter * (n-1)
+        freq_index_min = -int((np.log(smp_length) / np.log(gamma)))
+        freq_index_max = -int((np.log(inter) / np.log(gamma)))
+        freq_index = np.arange(freq_index_min, freq_index_max)
+        x = np.arange(n) * inter
+
+        return functools.partial(_profile_wm, x, freq_index, d, g, gamma, random, mem_budget)
+
+    def _sampler_dft(self, n, d, rq, inter, stable=True):
+        """ 返回离散傅里叶变换法的采样函数，参数同create_data_dft
         """
         # 判断采样点数n是否为2的幂次方，若n不是2的幂次方，则中断执行程序
         # 在GUI中，应用列表，保证输入为2的幂次方
@@ -60,62 +332,28 @@ class Mv2dCreator(object):
         tem_s = np.sum(1/np.power(i_n, tmp_1))
         tmp_2 = n**2 / (2 * tem_s)
         cof = np.sqrt(rq**2 * tmp_2)    # 尺度系数C
+        mag = cof * np.power(i_n, -tmp_1/2)     # 幅值包络
 
-        dft_cof = np.zeros(n, dtype=np.complex)   # 存储左侧离散傅里叶系数
-        dft_cof[0] = 0
-        dft_cof[n//2] = dft_cof[0]
-        for i_k in np.arange(1, n//2):  # 索引k
-            if not stable:
-                r = cof * np.power(i_k, -tmp_1/2) * np.random.rand()
-            else:
-                r = cof * np.power(i_k, -tmp_1 / 2)
-            p = np.random.uniform(0, 2*np.pi, 1)[0]
-            dft_cof[i_k] = np.complex(r * np.cos(p), r * np.sin(p))
-
-        dft_cof_conj = np.conj(dft_cof[1:n//2])[: : -1]
-        dft_cof[n//2+1 : ] = dft_cof_conj
-
-        self.data.value = np.real(scipy.ifft(dft_cof))
-        self.data.interval = inter
+        return functools.partial(_profile_dft, n, mag, stable)
 
-    def create_data_mpd(self, n: int, d: float, inter: float, sigma: float = 1):
-        """ 基于随机中点位移法生成分形数据
-
-        :param n: 采样点数，采样点数与迭代层数的关系为 n=2^{lev}+1
-        :param d: 分形维数，1<d<2
-        :param inter: 采样间隔
-        :param sigma: 期望的标准差
+    def _sampler_mpd(self, n, d, inter, sigma=1):
+        """ 返回随机中点位移法的采样函数，参数同create_data_mpd
         """
+        assert n >= 2 and np.log2(n).is_integer(), "输入的采样点数不是2的幂次方，程序退出"
         assert 1 < d < 2, "分形维数d必须满足：1<d<2"
 
-        hurst = 2 - d   # 计算Hurst指数
-        lev = int(np.log2(n))   # 迭代次数
-        n = n + 1   # 计算轮廓的总点数比输入总点数多1个，后面将第0个点去除
-
-        data = np.zeros(n, dtype=float)
-        data[0] = 0
-        data[n-1] = sigma * np.random.randn()
-
-        mid_one = (n-1)//2   # 每次迭代时的第一个点的序号
-                            # 此处为mid_one赋初值
-        d_sigma = sigma * (np.power(0.5, 2*hurst) - 0.25)
-
-        for i in range(0, lev):
-            i_end = 2 * mid_one     # 每次迭代第1个区间尾端点的序号
-            data[int(mid_one)] = 0.5*(data[0] + data[int(i_end)])+np.sqrt(d_sigma)*np.random.randn()
-            i_inc = 2 * mid_one
-            i_smp = mid_one + i_inc
-            while True:
-                if i_smp >= n-1:
-                    break
-                data[int(i_smp)]=0.5*(data[int(i_smp-i_inc/2)]+data[int(i_smp+i_inc/2)])+\
-                            np.sqrt(d_sigma)*np.random.randn()
-                i_smp = i_smp + i_inc
-            mid_one = mid_one / 2
-            d_sigma = np.power(0.5, 2*hurst)*d_sigma
-
-            self.data.value = data[1: n-1]     # 舍去第1个点
-            self.data.interval = inter
+        return functools.partial(_profile_mpd, n, d, sigma)
+
+    def save_data(self, fname):
+        """ 把当前轮廓数据保存为.npy文件及.json附属文件（采样间隔和生成参数）
+
+        :return: 实际写入的.npy文件名
+        """
+        return save_data(fname, self.data)
+
+    def load_data(self, fname, mmap_mode='r'):
+        """ 读取save_data保存的轮廓数据，默认以内存映射方式打开 """
+        self.data = load_data(fname, mmap_mode)
 
     def get_data(self):
         # assert self.data.data_value, "轮廓数据为None"
@@ -12,11 +12,22 @@ last edited:
 """
 import numpy as np
 from mv2d.mv_data2d import MvData2d
+from mv2d.mv_moments import amplitude_parameters
+from mv2d.mv_paracache import MvParaCache
+from mv2d.mv_fractal import profile_dimension
+from mv2d.mv_trace import traced
+from mv2d.mv_spatial import acf_1d, decay_length_1d
+
+RZ_SAMPLING_NUM = 5     # 计算Rp、Rv、Rz时的取样长度数
 
 
 class Mv2dParameter(object):
     """ 计算表征参数
     """
+    # 参数名到（参数组，组内序号）的映射，每组参数由对应的_compute_<组名>一次算出
+    _GROUPS = {'Rq': ('amplitude', 0), 'Ra': ('amplitude', 1), 'Rsk': ('amplitude', 2), 'Rku': ('amplitude', 3),
+               'Rp': ('height', 0), 'Rv': ('height', 1), 'Rz': ('height', 2), 'Rt': ('height', 3),
+               'Rdq': ('slope', 0), 'Ral': ('acf', 0)}
 
     def __init__(self, data: MvData2d = None):
         """ 构造函数
@@ -24,52 +35,144 @@ class Mv2dParameter(object):
         :param data: 二维数据，MvData类型
         """
         self.data = data
-        self.para_dict = {}  # 存储已计算的表征参数
+        self._cache = MvParaCache()  # 以数据版本为键的表征参数缓存
+
+    @property
+    def para_dict(self) -> dict:
+        """ 当前数据版本下已计算的表征参数，数据修改后自动清空
+        """
+        return self._cache.latest(self.data)
 
     def get_Rq(self, digits=4) -> float:
         """ 计算轮廓的均方根偏差（root mean square deviation） Rq
 
         :return: float 轮廓的均方根偏差（root mean square deviation） Rq
         """
-        data_value = self.data.value
-        Rq = np.sqrt(np.mean(np.power(data_value, 2)))
-        Rq = np.round(Rq, digits)
-        self.para_dict.setdefault('Rq', Rq)
-        return Rq
+        return self.compute_all(digits)['Rq']
 
     def get_Ra(self, digits=4) -> float:
         """ 计算轮廓的算术平均偏差（arithmetical mean deviation） Ra
 
         :return: float 轮廓的算术平均偏差（arithmetical mean deviation） Ra
         """
-        data_value = self.data.value
-        Ra = np.mean(np.abs(data_value))
-        Ra = np.round(Ra, digits)
-        self.para_dict.setdefault('Ra', Ra)
-        return Ra
+        return self.compute_all(digits)['Ra']
 
     def get_Rsk(self, digits=4) -> float:
         """ 计算轮廓的偏斜度（skewness） Rsk
 
         :return: float 轮廓的偏斜度（skewness） Rsk
         """
-        data_value = self.data.value
-        rq = self.get_Rq()
-        h3 = np.power(data_value, 3)  # 数据值的三次方
-        Rsk = np.mean(h3) / np.power(rq, 3)
-        Rsk = np.round(Rsk, digits)
-        self.para_dict.setdefault('Rsk', Rsk)
-        return Rsk
+        return self.compute_all(digits)['Rsk']
 
     def get_Rku(self, digits=4) -> float:
         """ 计算轮廓的陡度（kurtosis） Rku
 
         :return: float 轮廓的陡度（kurtosis） Rku
         """
-        data_value = self.data.value
-        rq = self.get_Rq()
-        h4 = np.power(data_value, 4)  # 数据值的四次方
-        Rku = np.mean(h4) / np.power(rq, 4)
-        Rku = np.round(Rku, digits)
-        self.para_dict.setdefault('Rku', Rku)
-        return Rku
+        return self.compute_all(digits)['Rku']
+
+    def get_Rp(self, digits=4) -> float:
+        """ 计算轮廓的最大峰高（maximum profile peak height） Rp，各取样长度的平均值
+
+        :return: float 轮廓的最大峰高 Rp
+        """
+        return self.compute(['Rp'], digits)['Rp']
+
+    def get_Rv(self, digits=4) -> float:
+        """ 计算轮廓的最大谷深（maximum profile valley depth） Rv，各取样长度的平均值
+
+        :return: float 轮廓的最大谷深 Rv
+        """
+        return self.compute(['Rv'], digits)['Rv']
+
+    def get_Rz(self, digits=4) -> float:
+        """ 计算轮廓的最大高度（maximum height of profile） Rz，各取样长度的平均值
+
+        :return: float 轮廓的最大高度 Rz
+        """
+        return self.compute(['Rz'], digits)['Rz']
+
+    def get_Rt(self, digits=4) -> float:
+        """ 计算轮廓的总高度（total height of profile） Rt
+
+        :return: float 轮廓的总高度 Rt
+        """
+        return self.compute(['Rt'], digits)['Rt']
+
+    def get_Rdq(self, digits=4) -> float:
+        """ 计算轮廓的均方根斜率（root mean square slope） Rdq
+
+        :return: float 轮廓的均方根斜率 Rdq
+        """
+        return self.compute(['Rdq'], digits)['Rdq']
+
+    def get_Ral(self, digits=4) -> float:
+        """ 计算轮廓的自相关长度（autocorrelation length） Ral，自相关函数衰减到0.2时的延迟距离
+
+        :return: float 轮廓的自相关长度 Ral
+        """
+        return self.compute(['Ral'], digits)['Ral']
+
+    def get_fractal_dimension(self, method='psd', digits=4) -> float:
+        """ 估计轮廓的分形维数
+
+        盒计数法（'box'）的估计值系统性地偏低，分形维数越大偏差越大，见mv_fractal.box_dimension_1d。
+
+        :param method: 'psd'、'variogram'、'box'或'roughness_length'，见mv2d.mv_fractal
+        :return: float 轮廓的分形维数
+        """
+        func = traced('Mv2dParameter.fractal.' + method, lambda: profile_dimension(self.data.value, method))
+        dim = self._cache.get(self.data, ('fractal', method), func)
+        paras = {'D': np.round(dim, digits)}
+        self._cache.update_latest(self.data, paras)
+        return paras['D']
+
+    def compute_all(self, digits=4) -> dict:
+        """ 一次遍历轮廓数据，计算全部幅度参数 Rq、Ra、Rsk、Rku
+
+        :return: dict 参数名到参数值的映射
+        """
+        return self.compute(['Rq', 'Ra', 'Rsk', 'Rku'], digits)
+
+    def compute(self, names, digits=4) -> dict:
+        """ 计算names中的表征参数，共用中间结果的参数（如同一组幅度参数）只计算一次
+
+        :param names: 参数名序列，可选'Rq'、'Ra'、'Rsk'、'Rku'、'Rp'、'Rv'、'Rz'、'Rt'、'Rdq'、'Ral'
+        :return: dict 参数名到参数值的映射
+        """
+        paras = {}
+        for name in names:
+            if name not in self._GROUPS:
+                raise ValueError("未知的表征参数：{}".format(name))
+            group, idx = self._GROUPS[name]
+            # 未取整的参数值与digits无关，按组缓存
+            func = traced('Mv2dParameter.' + group, getattr(self, '_compute_' + group))
+            raw = self._cache.get(self.data, group, func)
+            paras[name] = np.round(raw[idx], digits)
+        self._cache.update_latest(self.data, paras)
+        return paras
+
+    def _compute_amplitude(self):
+        return amplitude_parameters(self.data.value)
+
+    def _compute_height(self):
+        z = np.asarray(self.data.value, dtype=float)
+        rt = np.max(z) - np.min(z)
+        if z.size < 2 * RZ_SAMPLING_NUM:
+            # 每个取样长度至少需要两个点，否则Rp、Rv、Rz没有定义
+            return np.nan, np.nan, np.nan, rt
+        # RZ_SAMPLING_NUM个取样长度的峰高和谷深，各自相对本取样长度的中线计算，
+        # 数据点数不能整除时舍去末尾不足一个取样长度的点
+        num = z.size // RZ_SAMPLING_NUM
+        seg = z[:RZ_SAMPLING_NUM * num].reshape(RZ_SAMPLING_NUM, num)
+        seg = seg - np.mean(seg, axis=1, keepdims=True)
+        rp = np.mean(np.max(seg, axis=1))
+        rv = -np.mean(np.min(seg, axis=1))
+        return rp, rv, rp + rv, rt
+
+    def _compute_slope(self):
+        slope = np.diff(np.asarray(self.data.value, dtype=float)) / self.data.interval
+        return (np.sqrt(np.mean(slope * slope)),)
+
+    def _compute_acf(self):
+        return (decay_length_1d(acf_1d(self.data.value), self.data.interval),)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+可合并的流式统计量累加器
+
+MvStatsAccumulator逐块读入数据，以均值和各阶中心矩（Welford/Pébay递推）的形式保存统计量，
+两个累加器可按任意结合顺序合并，因此可以对内存映射的大表面逐行带统计，
+或由多个线程（进程）分别统计后合并。以零为基准的幅度参数由中心矩换算得到，
+与Mv2dParameter、Mv3dParameter的结果一致。
+"""
+import numpy as np
+from mv2d.mv_moments import MOMENT_BLOCK, moments_to_parameters
+
+ACCUMULATE_BAND = 2**22     # 按行带统计时每带的数据点数
+
+
+class MvStatsAccumulator(object):
+    """ 幅度参数、最值和直方图的累加器
+    """
+    def __init__(self, bins=None, hist_range=None):
+        """ 构造函数
+
+        :param bins: 直方图的分组数或分组边界，为None时不统计直方图
+        :param hist_range: 分组数为整数时直方图的范围(min, max)，范围外的数据不计入直方图
+        """
+        self.count = 0          # 数据点数
+        self.mean = 0.0         # 均值
+        self.m2 = 0.0           # 二、三、四阶中心矩之和
+        self.m3 = 0.0
+        self.m4 = 0.0
+        self.abs_sum = 0.0      # |h|之和
+        self.min = np.inf
+        self.max = -np.inf
+        self.hist = None        # 直方图各组的计数
+        self.edges = None       # 直方图的分组边界
+        if bins is not None:
+            if np.isscalar(bins) and hist_range is None:
+                raise ValueError("按分组数统计直方图时必须给出范围")
+            self.hist, self.edges = np.histogram([], bins, hist_range)
+
+    def update(self, chunk):
+        """ 读入一块数据（任意形状），按MOMENT_BLOCK分块计算后合并
+
+        :return: self
+        """
+        flat = np.reshape(chunk, -1)
+        for i_beg in range(0, flat.size, MOMENT_BLOCK):
+            blk = np.asarray(flat[i_beg:i_beg + MOMENT_BLOCK], dtype=float)
+            self.merge(self._from_block(blk))
+        return self
+
+    def _from_block(self, blk):
+        """ 由一块数据直接计算（两遍法）得到累加器 """
+        acc = MvStatsAccumulator()
+        acc.count = blk.size
+        acc.mean = np.mean(blk)
+        dev = blk - acc.mean
+        dev2 = dev * dev
+        acc.m2 = np.sum(dev2)
+        acc.m3 = np.sum(dev2 * dev)
+        acc.m4 = np.sum(dev2 * dev2)
+        acc.abs_sum = np.sum(np.abs(blk))
+        acc.min = np.min(blk)
+        acc.max = np.max(blk)
+        if self.edges is not None:
+            acc.edges = self.edges
+            acc.hist = np.histogram(blk, self.edges)[0]
+        return acc
+
+    def merge(self, other):
+        """ 把另一个累加器的统计量合并到本累加器（Pébay的成对合并公式）
+
+        :return: self
+        """
+        if other.count == 0:
+            return self
+        if self.edges is not None or other.edges is not None:
+            if self.edges is None or other.edges is None or not np.array_equal(self.edges, other.edges):
+                raise ValueError("直方图的分组不同，不能合并")
+        na, nb = self.count, other.count
+        n = na + nb
+        delta = other.mean - self.mean
+        # 高阶矩的修正项须用合并前的低阶矩，按m4、m3、m2的顺序更新
+        self.m4 += (other.m4 + delta**4 * na * nb * (na*na - na*nb + nb*nb) / n**3
+                    + 6 * delta**2 * (na*na * other.m2 + nb*nb * self.m2) / n**2
+                    + 4 * delta * (na * other.m3 - nb * self.m3) / n)
+        self.m3 += (other.m3 + delta**3 * na * nb * (na - nb) / n**2
+                    + 3 * delta * (na * other.m2 - nb * self.m2) / n)
+        self.m2 += other.m2 + delta**2 * na * nb / n
+        self.mean += delta * nb / n
+        self.count = n
+        self.abs_sum += other.abs_sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if self.edges is not None:
+            self.hist = self.hist + other.hist
+        return self
+
+    def raw_moments(self):
+        """ 以零为基准的各阶矩之和
+
+        :return: (点数, sum|h|, sum h^2, sum h^3, sum h^4)
+        """
+        n, mu = self.count, self.mean
+        s2 = self.m2 + n * mu**2
+        s3 = self.m3 + 3 * mu * self.m2 + n * mu**3
+        s4 = self.m4 + 4 * mu * self.m3 + 6 * mu**2 * self.m2 + n * mu**4
+        return n, self.abs_sum, s2, s3, s4
+
+    def amplitude_parameters(self):
+        """ 以零为基准的均方根偏差、算术平均偏差、偏斜度和陡度
+
+        :return: (q, a, sk, ku)，分别对应Rq/Sq、Ra/Sa、Rsk/Ssk、Rku/Sku
+        """
+        if self.count == 0:
+            raise ValueError("累加器中没有数据")
+        return moments_to_parameters(*self.raw_moments())
+
+    def parameters(self, prefix='S', digits=4) -> dict:
+        """ 以参数名为键返回幅度参数、均值和最值
+
+        :param prefix: 参数名前缀，轮廓为'R'，表面为'S'
+        """
+        q, a, sk, ku = self.amplitude_parameters()
+        return {prefix + 'q': np.round(q, digits), prefix + 'a': np.round(a, digits),
+                prefix + 'sk': np.round(sk, digits), prefix + 'ku': np.round(ku, digits),
+                'mean': np.round(self.mean, digits),
+                'min': np.round(self.min, digits), 'max': np.round(self.max, digits)}
+
+
+def accumulate_bands(data, bins=None, hist_range=None, band=ACCUMULATE_BAND, workers=None):
+    """ 按行带统计数据，可由多个线程并行完成
+
+    行带的划分只与band有关，各行带的累加器按行带顺序合并，因此结果与workers无关。
+    numpy的数组运算会释放GIL，对内存映射的数据，各线程同时读取不同的行带。
+
+    :param data: ndarray或np.memmap，第0轴为行
+    :param bins: 直方图的分组数或分组边界，为None时不统计直方图
+    :param hist_range: 直方图的范围
+    :param band: 每个行带的数据点数
+    :param workers: 线程数，为None或1时在当前线程中依次统计
+    :return: MvStatsAccumulator
+    """
+    row = max(1, int(np.prod(np.shape(data)[1:])))
+    rows = max(1, band // row)
+    bounds = [(r, min(r + rows, len(data))) for r in range(0, len(data), rows)]
+
+    def _band(bound):
+        return MvStatsAccumulator(bins, hist_range).update(data[bound[0]:bound[1]])
+
+    acc = MvStatsAccumulator(bins, hist_range)
+    if workers is None or workers <= 1:
+        for bound in bounds:
+            acc.merge(_band(bound))
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(workers) as pool:
+            for part in pool.map(_band, bounds):
+                acc.merge(part)
+    return acc
@@ -5,16 +5,46 @@
 邮箱：zandz1978@126.com
 最后编辑时间：
 """
+import functools
 import numpy as np
-import matplotlib.pyplot as plt
+
+
+@functools.lru_cache(maxsize=16)
+def sample_coords(n, interval, offset=0.0):
+    """ 采样点坐标offset + i*interval，i = 0..n-1
+
+    相同的参数返回同一个只读ndarray，重复绘制同样大小的数据时不再重新分配坐标数组。
+    """
+    coords = offset + np.arange(n) * interval
+    coords.setflags(write=False)
+    return coords
 
 
 class MvData2d(object):
-    """ 自定义的数据类型
+    """ 自定义的数据类型，存放轮廓（一维）或表面（二维）的高度数据、采样间隔及生成参数
+
+    value可以是ndarray或np.memmap，赋值和切片都不复制数据；np.asarray(data)直接使用value的内存。
+    没有实现缓冲区协议（__buffer__只在Python 3.12及以上有效），需要memoryview等缓冲区接口时请使用data.value。
     """
-    def __init__(self, value=None, interval=1.0):
-        self.__value = value        # 一维ndarray，存储轮廓高度数据
+    __slots__ = ('__value', '__interval', '__version', '__meta')
+
+    META_KEYS = ('method', 'd', 'target', 'seed')   # 生成参数：建模算法、分形维数、目标Rq/Sq/Sa、随机数种子
+
+    def __init__(self, value=None, interval=1.0, dtype=None, **meta):
+        """ 构造函数
+
+        :param value: 高度数据，非ndarray时转换为ndarray
+        :param interval: 采样间隔
+        :param dtype: 数据类型，为None时保持value的类型，否则在需要时转换
+        :param meta: 生成参数，见META_KEYS
+        """
+        if value is not None and (dtype is not None or not isinstance(value, np.ndarray)):
+            value = np.asarray(value, dtype=dtype)
+        self.__value = value        # ndarray，存储轮廓或表面高度数据
         self.__interval = interval  # float, 采样间隔
+        self.__version = 0          # int, 修改计数，每次修改数据或采样间隔时加1
+        self.__meta = dict.fromkeys(self.META_KEYS)
+        self.__meta.update(meta)
 
     @property
     def interval(self):
@@ -25,6 +55,7 @@ class MvData2d(object):
         if interval <= 0:
             raise ValueError("采样间隔值必须大于0")
         self.__interval = interval
+        self.__version += 1
 
     @property
     def value(self):
@@ -32,7 +63,93 @@ class MvData2d(object):
 
     @value.setter
     def value(self, value):
+        if value is not None and not isinstance(value, np.ndarray):
+            value = np.asarray(value)
         self.__value = value
+        self.__version += 1
+
+    @property
+    def version(self):
+        return self.__version
+
+    @property
+    def meta(self) -> dict:
+        """ 生成参数的副本 """
+        return dict(self.__meta)
+
+    def set_meta(self, **meta):
+        """ 重新设置生成参数，未给出的项置为None """
+        self.__meta = dict.fromkeys(self.META_KEYS)
+        self.__meta.update(meta)
+
+    @property
+    def dtype(self):
+        return self.__value.dtype
+
+    @property
+    def shape(self):
+        return self.__value.shape
+
+    @property
+    def ndim(self):
+        return self.__value.ndim
+
+    @property
+    def nbytes(self):
+        return self.__value.nbytes
+
+    @property
+    def is_memmap(self):
+        """ 数据是否为内存映射文件 """
+        return isinstance(self.__value, np.memmap)
+
+    def touch(self):
+        """ 原地修改value数组的内容后调用，使依赖数据版本的缓存失效
+        """
+        self.__version += 1
+
+    def __len__(self):
+        return len(self.__value)
+
+    def __getitem__(self, key):
+        """ 返回共用数据的切片视图，按切片步长放大采样间隔
+
+        各方向的步长必须相同，否则采样间隔无法用一个数表示。
+        """
+        keys = key if isinstance(key, tuple) else (key,)
+        # 把Ellipsis和未给出的方向展开为完整切片（步长为1），None（np.newaxis）不占用方向
+        n_rest = self.__value.ndim - sum(1 for k in keys if k is not None and k is not Ellipsis)
+        if Ellipsis in keys:
+            i = keys.index(Ellipsis)
+            keys = keys[:i] + (slice(None),) * n_rest + keys[i+1:]
+        else:
+            keys += (slice(None),) * n_rest
+        steps = {k.step or 1 for k in keys if isinstance(k, slice)}
+        if len(steps) > 1:
+            raise ValueError("各方向的切片步长必须相同")
+        step = steps.pop() if steps else 1
+        return MvData2d(self.__value[key], self.__interval * abs(step), **self.__meta)
+
+    def view(self):
+        """ 返回共用同一数据数组的新对象 """
+        return MvData2d(self.__value, self.__interval, **self.__meta)
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None or dtype == self.__value.dtype:
+            return np.asarray(self.__value) if not copy else np.array(self.__value)
+        return np.array(self.__value, dtype=dtype)
+
+    def __repr__(self):
+        if self.__value is None:
+            return 'MvData2d(None, interval={})'.format(self.__interval)
+        meta = ', '.join('{}={!r}'.format(k, v) for k, v in self.__meta.items() if v is not None)
+        return 'MvData2d(shape={}, dtype={}, interval={}{}{})'.format(
+            self.__value.shape, self.__value.dtype, self.__interval,
+            ', memmap' if self.is_memmap else '', ', ' + meta if meta else '')
+
+    def coords(self):
+        """ 轮廓采样点的坐标（只读，见sample_coords） """
+        return sample_coords(np.size(self.__value), float(self.__interval))
 
     def draw_profile(self, ax1):
         """ 根据成员变量中的数据，绘制轮廓
@@ -40,13 +157,13 @@ class MvData2d(object):
         :param ax1: 绘制图形的axes
         :param param_dict: 存储赋给ax.plot的绘图参数
         """
-        sn = np.size(self.__value)  # 轮廓采样点数
-        x_value = np.arange(0, self.__interval * sn, self.__interval)
-        profile = ax1.plot(x_value, self.__value)
+        profile = ax1.plot(self.coords(), self.__value)
         return profile
 
 
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+
     md = MvData2d()
     values = np.array([1, 2, 3, 4, 5])
 
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+轮廓和表面数据的二进制文件格式
+
+高度数据保存为.npy文件，采样间隔和生成参数保存在同名的.json附属文件中。
+读取时以内存映射方式打开.npy文件，大文件无需读入内存即可计算参数或绘图。
+"""
+import json
+import mmap
+import os
+import numpy as np
+from mv2d.mv_data2d import MvData2d
+
+FORMAT_NAME = 'microview'
+FORMAT_VERSION = 1
+
+
+def npy_name(fname):
+    """ 补足.npy扩展名后的数据文件名，与np.save的规则相同 """
+    return fname if fname.endswith('.npy') else fname + '.npy'
+
+
+def meta_name(fname):
+    """ 数据文件对应的.json附属文件名 """
+    return os.path.splitext(npy_name(fname))[0] + '.json'
+
+
+def _to_builtin(value):
+    """ 把numpy标量转换为可写入json的Python类型 """
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def save_meta(fname, data: MvData2d):
+    """ 只写入.json附属文件，用于数据已经在fname中的情况（如分块生成的表面）
+
+    :param fname: .npy数据文件名
+    :param data: MvData2d
+    """
+    info = {'format': FORMAT_NAME, 'version': FORMAT_VERSION,
+            'interval': _to_builtin(data.interval),
+            'meta': {k: _to_builtin(v) for k, v in data.meta.items()}}
+    with open(meta_name(fname), 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, indent=1)
+
+
+def _maps_file(value, fname):
+    """ value是否为内存映射到文件fname的数组（含其切片、转置等视图） """
+    src = getattr(value, 'filename', None)
+    return src is not None and os.path.exists(fname) and os.path.samefile(src, fname)
+
+
+def _maps_whole_file(value, fname):
+    """ value是否为内存映射了fname中整个数组的np.memmap本身，而不是它的视图
+
+    视图的base为原np.memmap，且沿用原数组的filename和offset，只有base为mmap对象的才是原数组；
+    再与文件头中的形状、类型和存储顺序比较，排除只映射了部分数据的情况。
+    """
+    if not isinstance(value.base, mmap.mmap):
+        return False
+    with open(fname, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    contiguous = value.flags.f_contiguous if fortran else value.flags.c_contiguous
+    return value.offset == offset and value.shape == shape and value.dtype == dtype and contiguous
+
+
+def save_data(fname, data: MvData2d):
+    """ 保存高度数据、采样间隔和生成参数
+
+    数据为内存映射了同一文件中整个数组的np.memmap时只写入附属文件；数据为同一文件的视图（切片等）时
+    先读入内存再写出，避免写文件时截断正在映射的数据；否则由np.save按缓冲块写出，
+    对其他文件的内存映射数组的切片也不会整体复制。
+
+    :param fname: 数据文件名，不以.npy结尾时自动添加
+    :param data: MvData2d
+    :return: 实际写入的.npy文件名
+    """
+    if data.value is None:
+        raise ValueError("没有可保存的数据")
+    fname = npy_name(fname)
+    if not _maps_file(data.value, fname):
+        np.save(fname, data.value)
+    elif not _maps_whole_file(data.value, fname):
+        np.save(fname, np.array(data.value))
+    save_meta(fname, data)
+    return fname
+
+
+def load_data(fname, mmap_mode='r') -> MvData2d:
+    """ 读取save_data保存的数据，也可读取没有附属文件的.npy文件（采样间隔取1）
+
+    :param fname: .npy数据文件名
+    :param mmap_mode: 内存映射模式，同np.load；为None时把数据全部读入内存
+    :return: MvData2d
+    """
+    fname = npy_name(fname)
+    value = np.load(fname, mmap_mode=mmap_mode)
+    interval, meta = 1.0, {}
+    if os.path.exists(meta_name(fname)):
+        with open(meta_name(fname), encoding='utf-8') as f:
+            info = json.load(f)
+        if info.get('format') != FORMAT_NAME:
+            raise ValueError("不是MicroView数据文件：{}".format(meta_name(fname)))
+        interval = info['interval']
+        meta = info.get('meta', {})
+    return MvData2d(value, interval, **meta)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+批量（集合）生成分形轮廓和表面时使用的公共工具
+
+各建模算法的核心计算以“采样函数”的形式给出：采样函数接收一组随机源rngs，
+每个随机源对应一个样本，返回形状为(len(rngs), ...)的数组。随机源可以是np.random模块
+本身（全局随机状态），也可以是np.random.RandomState对象。
+
+给定随机数种子时，第i个样本使用由种子和i派生的独立随机数流（见get_stream），
+采样函数对每个样本的计算与同批的样本数无关，因此相同的种子在任意进程数和分块大小下得到逐位相同的结果。
+并行生成时，各工作进程把结果直接写入共享内存，不对大数组进行序列化。
+"""
+import numpy as np
+
+ENSEMBLE_CHUNK_BYTES = 16 * 2**20   # 每批样本数据的内存上限（字节），也是并行生成时每个任务大小的上限
+
+_worker_state = {}  # 工作进程中的采样函数、种子和共享内存结果数组
+
+
+def draw_stacked(rngs, dist, *args, size=()):
+    """ 从每个随机源各抽取一组形状为size的随机数，并沿第0轴堆叠
+
+    若所有随机源为同一对象，则一次性抽取全部随机数，其顺序与逐个样本抽取相同。
+
+    :param rngs: 随机源序列，每个样本一个
+    :param dist: 随机源的抽样方法名，如'random_sample'、'uniform'、'standard_normal'
+    :param args: 传给抽样方法的分布参数
+    :param size: 每个样本的随机数形状
+    :return: 形状为(len(rngs),)+size的ndarray
+    """
+    size = (size,) if np.isscalar(size) else tuple(size)
+    if all(r is rngs[0] for r in rngs):
+        return getattr(rngs[0], dist)(*args, size=(len(rngs),) + size)
+    return np.stack([getattr(r, dist)(*args, size=size) for r in rngs])
+
+
+def get_stream(seed, *key):
+    """ 返回由种子seed派生、以key标识的独立随机数流
+
+    get_stream(seed, i)与np.random.SeedSequence(seed).spawn(k)[i]相同，但不需要生成前i个子序列；
+    key可由多个非负整数组成，用于按（层、行）等多级序号区分随机数流。
+
+    :param seed: 非负整数种子
+    :param key: 随机数流的序号
+    :return: np.random.RandomState
+    """
+    seq = np.random.SeedSequence(seed, spawn_key=key)
+    return np.random.RandomState(np.random.MT19937(seq))
+
+
+def _sample_streams(sampler, seed, i_beg, i_end):
+    """ 用第i_beg至i_end-1个随机数流生成样本 """
+    return sampler([get_stream(seed, i) for i in range(i_beg, i_end)])
+
+
+def _init_worker(sampler, seed, shm_name, shape, dtype):
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_state.update(sampler=sampler, seed=seed, shm=shm,
+                         out=np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+
+def _run_task(bounds):
+    t_beg, t_end, i_beg = bounds
+    sample = _sample_streams(_worker_state['sampler'], _worker_state['seed'], t_beg, t_end)
+    _worker_state['out'][t_beg-i_beg:t_end-i_beg] = sample
+
+
+class _SharedPool(object):
+    """ 并行生成时的进程池和共享内存结果数组，可在各块样本之间重复使用
+
+    共享内存可容纳rows个样本，在第一次生成时按样本形状分配，同时启动进程池。
+    """
+    def __init__(self, sampler, seed, workers, rows):
+        self.sampler = sampler
+        self.seed = seed
+        self.workers = workers
+        self.rows = rows
+        self.shm = None
+        self.pool = None
+        self.out = None
+
+    def _start(self, first):
+        # 进程池和共享内存只在并行生成时导入，不增加模块的导入时间
+        import multiprocessing
+        from multiprocessing import shared_memory
+        shape = (self.rows,) + first.shape[1:]
+        self.shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * first.itemsize, 1))
+        self.out = np.ndarray(shape, dtype=first.dtype, buffer=self.shm.buf)
+        self.pool = multiprocessing.Pool(min(self.workers, max(1, self.rows - 1)), initializer=_init_worker,
+                                         initargs=(self.sampler, self.seed, self.shm.name, shape, first.dtype))
+
+    def run(self, first, i_beg, i_end, bounds):
+        """ 并行完成bounds中的任务，返回第i_beg至i_end-1个样本，第一个样本为first """
+        if self.pool is None:
+            self._start(first)
+        out = self.out[:i_end - i_beg]
+        out[0] = first[0]
+        self.pool.map(_run_task, [(t_beg, t_end, i_beg) for t_beg, t_end in bounds], chunksize=1)
+        return out.copy()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self.shm is not None:
+            self.out = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+def _create_seeded(sampler, seed, i_beg, i_end, workers, shared=None):
+    """ 用随机数流生成第i_beg至i_end-1个样本
+
+    第一个样本先在当前进程中生成，以确定样本形状和任务大小；其余样本分为任务，
+    由当前进程依次完成，或由进程池并行完成并写入共享内存。并行时任务数不少于进程数。
+
+    :param shared: 并行生成时使用的_SharedPool，为None时临时创建
+    """
+    first = _sample_streams(sampler, seed, i_beg, i_beg+1)
+    shape = (i_end - i_beg,) + first.shape[1:]
+    task = max(1, ENSEMBLE_CHUNK_BYTES // max(first.nbytes, 1))
+    parallel = workers is not None and workers > 1 and i_end - i_beg > 1
+    if parallel:
+        task = min(task, -(-(i_end - i_beg - 1) // workers))
+    bounds = [(t, min(t + task, i_end)) for t in range(i_beg+1, i_end, task)]
+
+    if not parallel:
+        out = np.empty(shape, dtype=first.dtype)
+        out[0] = first[0]
+        for t_beg, t_end in bounds:
+            out[t_beg-i_beg:t_end-i_beg] = _sample_streams(sampler, seed, t_beg, t_end)
+        return out
+
+    if shared is not None:
+        return shared.run(first, i_beg, i_end, bounds)
+    shared = _SharedPool(sampler, seed, workers, i_end - i_beg)
+    try:
+        return shared.run(first, i_beg, i_end, bounds)
+    finally:
+        shared.close()
+
+
+def iter_ensemble(sampler, k, chunk_size, seed=None, workers=None):
+    """ 分块调用采样函数，依次产生共k个样本
+
+    并行生成时各块共用一个进程池和一块共享内存。
+
+    :param sampler: 采样函数，参数为随机源序列
+    :param k: 样本总数
+    :param chunk_size: 每块的样本数
+    :param seed: 随机数种子，为None时使用全局随机状态
+    :param workers: 生成每块样本时使用的进程数
+    :return: 迭代器，每次产生形状为(<=chunk_size, ...)的ndarray
+    """
+    if seed is None:
+        for i_beg in range(0, k, chunk_size):
+            yield sampler([np.random] * (min(i_beg + chunk_size, k) - i_beg))
+        return
+
+    shared = None
+    if workers is not None and workers > 1:
+        shared = _SharedPool(sampler, seed, workers, min(chunk_size, k))
+    try:
+        for i_beg in range(0, k, chunk_size):
+            yield _create_seeded(sampler, seed, i_beg, min(i_beg + chunk_size, k), workers, shared)
+    finally:
+        if shared is not None:
+            shared.close()
+
+
+def create_ensemble(sampler, k, chunk_size=None, seed=None, workers=None):
+    """ 用采样函数生成k个样本
+
+    :param sampler: 采样函数，参数为随机源序列；并行生成时须可被pickle
+    :param k: 样本总数
+    :param chunk_size: 为None时一次生成全部样本；否则返回每次产生至多chunk_size个样本的迭代器
+    :param seed: 随机数种子，为None且workers为None时使用全局随机状态，
+                 为None而workers不为None时随机选取一个种子
+    :param workers: 并行生成的进程数，为None或1时在当前进程中生成
+    :return: 形状为(k, ...)的ndarray，或迭代器
+    """
+    if k < 1:
+        raise ValueError("样本数必须大于0")
+    if chunk_size is not None and chunk_size < 1:
+        raise ValueError("每块的样本数必须大于0")
+    if seed is None and workers is not None:
+        seed = np.random.SeedSequence().entropy
+
+    if chunk_size is not None:
+        return iter_ensemble(sampler, k, chunk_size, seed, workers)
+    if seed is not None:
+        return _create_seeded(sampler, seed, 0, k, workers)
+
+    # 分批生成后写入结果数组，使每批的临时数组保持在ENSEMBLE_CHUNK_BYTES左右
+    first = sampler([np.random])
+    out = np.empty((k,) + first.shape[1:], dtype=first.dtype)
+    out[0] = first[0]
+    chunk = max(1, ENSEMBLE_CHUNK_BYTES // max(first.nbytes, 1))
+    for i_beg in range(1, k, chunk):
+        i_end = min(i_beg + chunk, k)
+        out[i_beg:i_end] = sampler([np.random] * (i_end - i_beg))
+    return out
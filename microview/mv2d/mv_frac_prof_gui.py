@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 import sys
 import PySide2
-from PySide2.QtCore import QRegExp
+from PySide2.QtCore import QRegExp, QTimer
 from PySide2.QtWidgets import *
 from PySide2 import QtWidgets
 from PySide2.QtGui import QFont, QRegExpValidator, QIcon
@@ -12,7 +12,11 @@ import matplotlib
 import numpy as np
 from mv2d.mv_2dcreator import Mv2dCreator
 from mv2d.mv_2dparameter import Mv2dParameter
+from mv2d import mv_trace
 from mv2d.mv_data2d import MvData2d
+from mv2d.mv_datafile import load_data, save_data
+from mv2d.mv_progress import sub_progress
+from mv2d.mv_worker import MvJobRunner
 
 
 class MvFractalProfileGui(QMainWindow):
@@ -28,7 +32,19 @@ class MvFractalProfileGui(QMainWindow):
         self.canvas = FigureCanvas(self.figure)
         self.ax = self.figure.add_subplot(111)
         matplotlib.rcParams["font.family"] = "STSong"
+        self.ax.set_xlabel('profile direction')
+        self.ax.set_ylabel('height')
+        self.ax.set_title('分形轮廓')
+        self._line = None   # 轮廓线，重绘时只更新其数据
         # --------
+        self._trace_since = None    # 当前任务开始的时间，用于状态栏显示各阶段耗时
+
+        # 建模和参数计算在后台线程中进行，结果交回界面线程后绘图
+        self.runner = MvJobRunner(self)
+        self.runner.progress.connect(self._on_job_progress)
+        self.runner.finished.connect(self._on_profile_ready)
+        self.runner.failed.connect(self._on_job_failed)
+        self.runner.cancelled.connect(self._on_job_cancelled)
 
         self._init_ui()
 
@@ -41,9 +57,28 @@ class MvFractalProfileGui(QMainWindow):
         # --------
         self.status = self.statusBar()
         self.status.showMessage("分形轮廓建模及表征参数计算", 10000)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setMaximumWidth(160)
+        self.btn_cancel = QPushButton("取消")
+        self.btn_cancel.setToolTip("取消正在进行的建模")
+        self.btn_cancel.clicked.connect(self.runner.cancel)
+        self.status.addPermanentWidget(self.progress_bar)
+        self.status.addPermanentWidget(self.btn_cancel)
+        self._set_busy(False)
         # --------
         # 菜单 ---------
         self.menu = self.menuBar()
+        tool_menu = self.menu.addMenu("工具")
+        self.act_trace = QAction("性能跟踪", self)
+        self.act_trace.setCheckable(True)
+        self.act_trace.setStatusTip("记录建模、参数计算和绘图各阶段的耗时，显示在状态栏")
+        self.act_trace.toggled.connect(mv_trace.enable)
+        act_export = QAction("导出跟踪...", self)
+        act_export.setStatusTip("把记录的各阶段耗时导出为Chrome跟踪格式的json文件")
+        act_export.triggered.connect(self._export_trace)
+        tool_menu.addAction(self.act_trace)
+        tool_menu.addAction(act_export)
         help_menu = self.menu.addMenu("帮助")
         about_action = QAction("关于...", self)
         help_menu.addAction(about_action)
@@ -73,7 +108,8 @@ class MvFractalProfileGui(QMainWindow):
         self._set_button()  # 功能按钮区布局
         self._set_show_para()  # 基本参数显示区域布局
 
-        self._draw_fractal_profile()
+        # 初始轮廓在事件循环开始、窗口显示之后再生成和绘制
+        QTimer.singleShot(0, self._draw_fractal_profile)
 
     def _set_matplotlib_layout(self):
         self.toolbar = NavigationToolbar(self.canvas, self.c_widget)
@@ -86,7 +122,13 @@ class MvFractalProfileGui(QMainWindow):
         self.left_layout_lev1.addWidget(self.toolbar)
 
     def _equal_state(self):
-        self._redraw()
+        # 只改变坐标轴的显示方式，不重绘轮廓数据
+        if self.cbx_equal.isChecked():
+            self.ax.axis('equal')
+        else:
+            self.ax.axis('auto')
+            self.ax.autoscale_view()
+        self.canvas.draw_idle()
 
     def _set_model_method(self):
         group_method = QGroupBox("选择建模算法")
@@ -172,15 +214,43 @@ class MvFractalProfileGui(QMainWindow):
         # self.right_layout_lev1.addWidget(self.btn_export)
         self.btn_export.clicked.connect(self._exprot_profile_data)
 
+        self.btn_import = QPushButton("导入...")
+        self.btn_import.setToolTip("单击导入轮廓数据")
+        self.btn_import.clicked.connect(self._import_profile_data)
+
         func_btn_layout.addWidget(self.btn_draw)
         func_btn_layout.addWidget(self.btn_export)
+        func_btn_layout.addWidget(self.btn_import)
         self.right_layout_lev1.addLayout(func_btn_layout)
 
     def _exprot_profile_data(self):
-        fname, ftype = QFileDialog.getSaveFileName(self, "保存文件", ".", "Text Files (*.txt)")
-        np.savetxt(fname, self.data.value)
+        if self.data.value is None:
+            QMessageBox.warning(self, "警告", "没有可导出的数据，请先建模或导入数据")
+            return
+        fname, ftype = QFileDialog.getSaveFileName(self, "保存文件", ".",
+                                                   "MicroView Files (*.npy);;Text Files (*.txt)")
+        if not fname:
+            return
+        if ftype.startswith("Text"):
+            np.savetxt(fname, self.data.value)
+        else:
+            save_data(fname, self.data)
         QMessageBox.information(self, "信息", "完成数据导出")
 
+    def _import_profile_data(self):
+        fname, ftype = QFileDialog.getOpenFileName(self, "打开文件", ".", "MicroView Files (*.npy)")
+        if not fname:
+            return
+        data = load_data(fname)
+        if data.ndim != 1:
+            QMessageBox.warning(self, "警告", "文件中的数据不是轮廓数据")
+            return
+        self.data = data
+        since = mv_trace.now()
+        self._redraw()
+        self._show_paras()
+        self._show_trace(since)
+
 
     def _set_show_para(self):
         self.table_widget = QTableWidget()
@@ -200,66 +270,94 @@ class MvFractalProfileGui(QMainWindow):
         item_1 = QTableWidgetItem("Rku")
         self.table_widget.setItem(3, 0, item_1)
 
-    def _draw_fractal_profile(self):
-        profile_crtor = Mv2dCreator()
-        if self.method == "离散傅里叶逆变换":
-            dim = float(self.edt_dim.text())
-            sq = float(self.edt_sq.text())
-            num = int(self.cbx_num.currentText())
-            inter = float(self.edt_inter.text())
-            is_stable = self.chx_stable.isChecked()
-            profile_crtor.create_data_dft(num, dim, sq, inter, is_stable)
-        elif self.method == "随机中点位移法":
-            dim = float(self.edt_dim.text())
-            sq = float(self.edt_sq.text())
-            num = int(self.cbx_num.currentText())
-            inter = float(self.edt_inter.text())
-            profile_crtor.create_data_mpd(num, dim, inter, sq)
-        else:
-            dim = float(self.edt_dim.text())
-            sq = float(self.edt_sq.text())
-            num = int(self.cbx_num.currentText())
-            inter = float(self.edt_inter.text())
-            is_stable = self.chx_stable.isChecked()
-            profile_crtor.create_data_wm(num, dim, sq, inter, is_stable)
+    def _export_trace(self):
+        fname, ftype = QFileDialog.getSaveFileName(self, "保存文件", ".", "Chrome Trace Files (*.json)")
+        if not fname:
+            return
+        count = mv_trace.export_chrome_trace(fname)
+        QMessageBox.information(self, "信息", "导出了{}个跟踪事件".format(count))
 
-        self.data = profile_crtor.get_data()
+    def _show_trace(self, since):
+        """ 在状态栏显示since之后各阶段的耗时 """
+        if mv_trace.is_enabled():
+            self.status.showMessage(mv_trace.format_summary(mv_trace.events(since)))
 
-        self._redraw()
+    def _set_busy(self, busy):
+        self.progress_bar.setVisible(busy)
+        self.btn_cancel.setVisible(busy)
+        if busy:
+            self.progress_bar.setValue(0)
 
-        paras = Mv2dParameter(self.data)
-        rq = paras.get_Rq()
-        item_1 = QTableWidgetItem(str(rq))
-        self.table_widget.setItem(0, 1, item_1)
+    def _on_job_progress(self, fraction, stage):
+        self.progress_bar.setValue(int(100 * fraction))
+        self.status.showMessage(stage)
 
-        ra = paras.get_Ra()
-        item_1 = QTableWidgetItem(str(ra))
-        self.table_widget.setItem(1, 1, item_1)
+    def _on_job_failed(self, message):
+        self._set_busy(False)
+        QMessageBox.warning(self, "警告", "建模失败：{}".format(message))
 
-        rsk = paras.get_Rsk()
-        item_1 = QTableWidgetItem(str(rsk))
-        self.table_widget.setItem(2, 1, item_1)
+    def _on_job_cancelled(self):
+        self._set_busy(False)
+        self.status.showMessage("已取消建模", 5000)
 
-        rku = paras.get_Rku()
-        item_1 = QTableWidgetItem(str(rku))
-        self.table_widget.setItem(3, 1, item_1)
+    def _draw_fractal_profile(self):
+        """ 在后台线程中建模并计算参数，再次单击时取代尚未完成的建模 """
+        dim = float(self.edt_dim.text())
+        sq = float(self.edt_sq.text())
+        num = int(self.cbx_num.currentText())
+        inter = float(self.edt_inter.text())
+        is_stable = self.chx_stable.isChecked()
+        method = self.method
+
+        def job(progress):
+            profile_crtor = Mv2dCreator()
+            gen_progress = sub_progress(progress, 0.0, 0.8)
+            if method == "离散傅里叶逆变换":
+                profile_crtor.create_data_dft(num, dim, sq, inter, is_stable, progress=gen_progress)
+            elif method == "随机中点位移法":
+                profile_crtor.create_data_mpd(num, dim, inter, sq, progress=gen_progress)
+            else:
+                profile_crtor.create_data_wm(num, dim, sq, inter, is_stable, progress=gen_progress)
+            progress(0.8, "计算表征参数")
+            data = profile_crtor.get_data()
+            return data, Mv2dParameter(data).compute_all()
+
+        self._trace_since = mv_trace.now()
+        self._set_busy(True)
+        self.runner.submit(job)
+
+    def _on_profile_ready(self, result):
+        self.data, paras = result
+        self._on_job_progress(0.95, "绘制轮廓")
+        self._redraw()
+        self._show_paras(paras)
+        self._set_busy(False)
+        self.status.clearMessage()
+        self._show_trace(self._trace_since)
+
+    def _show_paras(self, paras=None):
+        if paras is None:
+            paras = Mv2dParameter(self.data).compute_all()
+        for row, name in enumerate(['Rq', 'Ra', 'Rsk', 'Rku']):
+            item_1 = QTableWidgetItem(str(paras[name]))
+            self.table_widget.setItem(row, 1, item_1)
 
     def _redraw(self):
-        is_equal = self.cbx_equal.isChecked()
-
-        self.ax.cla()
-        self.data.draw_profile(self.ax)
-
-        if is_equal:
-            self.ax.axis('equal')
-        else:
-            self.ax.axis('auto')
-
-        self.ax.set_xlabel('profile direction')
-        self.ax.set_ylabel('height')
-        self.ax.set_title('分形轮廓')
-
-        self.canvas.draw()
+        """ 显示新的轮廓数据（只改变显示方式时见_equal_state） """
+        # 坐标轴、标题和等比例设置保持不变，只更新轮廓线的数据和坐标范围
+        with mv_trace.span('MvFractalProfileGui.draw_profile'):
+            if self._line is None:
+                self._line, = self.data.draw_profile(self.ax)
+            else:
+                self._line.set_data(self.data.coords(), self.data.value)
+            # 工具栏的缩放、平移会关闭自动缩放，新数据按其范围重新缩放，并清除缩放历史
+            self.ax.autoscale(True)
+            self.ax.relim()
+            self.ax.autoscale_view()
+            self.toolbar.update()
+
+        with mv_trace.span('MvFractalProfileGui.canvas_draw'):
+            self.canvas.draw()
 
     def _help_process(self, g):
         if g.text() == "关于...":
@@ -289,6 +387,9 @@ class MvFractalProfileGui(QMainWindow):
                                      QMessageBox.No, QMessageBox.No)
 
         if reply == QMessageBox.Yes:
+            # 等待后台任务在下一个检查点停止后再关闭窗口
+            self.runner.cancel()
+            self.runner.wait()
             event.accept()
         else:
             event.ignore()
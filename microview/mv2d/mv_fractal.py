@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+轮廓和表面分形维数的估计
+
+提供功率谱斜率法、变差函数（结构函数）法、盒计数法（表面为立方体计数法）和粗糙度-长度法。
+各方法对全部尺度同时计算（FFT或逐级归约），不对单个盒子或窗口循环。
+
+数据可以是一批样本：轮廓为形状(..., n)的数组，表面为形状(..., ny, nx)的数组，
+返回值为形状(...)的分形维数数组，单个轮廓或表面时返回float。
+"""
+import numpy as np
+
+PSD_BINS = 24           # 功率谱斜率法中对数等距频率分组数
+VARIOGRAM_LAGS = 24     # 变差函数法中对数等距延迟的个数
+MIN_WINDOW = 4          # 粗糙度-长度法的最小窗口点数
+MIN_BOX_SEGMENTS = 8    # 盒计数法取用的最少采样间隔数，此时有边长为1和2个采样间隔的两种盒子
+
+
+def _fit_slope(x, y):
+    """ 对y的最后一维关于共同的x做最小二乘直线拟合，返回斜率 """
+    x = x - np.mean(x)
+    y = y - np.mean(y, axis=-1, keepdims=True)
+    return np.sum(y * x, axis=-1) / np.sum(x * x)
+
+
+def _as_result(dim):
+    return float(dim) if np.ndim(dim) == 0 else dim
+
+
+def _log_binned_fit(freq, log_power, n_bin):
+    """ 按频率的对数等距分组后，对各组平均的log(功率)关于log(频率)拟合斜率
+
+    :param freq: 一维ndarray，各频率点的频率（>0）
+    :param log_power: 形状为(batch, freq.size)的ndarray
+    :return: 形状为(batch,)的斜率
+    """
+    log_f = np.log(freq)
+    edges = np.linspace(log_f.min(), log_f.max(), n_bin + 1)
+    idx = np.clip(np.searchsorted(edges, log_f, side='right') - 1, 0, n_bin - 1)
+    cnt = np.bincount(idx, minlength=n_bin)
+    used = cnt > 0
+    f_bin = np.bincount(idx, weights=log_f, minlength=n_bin)[used] / cnt[used]
+
+    # 各样本的分组求和一次完成：样本b的第i组对应位置b*n_bin+i
+    batch = log_power.shape[0]
+    flat_idx = (idx[np.newaxis, :] + n_bin * np.arange(batch)[:, np.newaxis]).ravel()
+    p_bin = np.bincount(flat_idx, weights=log_power.ravel(), minlength=batch * n_bin)
+    p_bin = p_bin.reshape(batch, n_bin)[:, used] / cnt[used]
+    return _fit_slope(f_bin, p_bin)
+
+
+def psd_dimension_1d(z, n_bin=PSD_BINS):
+    """ 功率谱斜率法：轮廓的功率谱P(f)~f^(-beta)，D=(5-beta)/2
+
+    :param z: 形状为(..., n)的ndarray
+    :param n_bin: 拟合前的频率分组数
+    """
+    z = np.asarray(z, dtype=float)
+    n = z.shape[-1]
+    spec = np.fft.rfft(z - np.mean(z, axis=-1, keepdims=True), axis=-1)[..., 1:n//2]
+    log_power = np.log(spec.real**2 + spec.imag**2 + np.finfo(float).tiny)
+    freq = np.arange(1, n//2, dtype=float)
+    beta = -_log_binned_fit(freq, log_power.reshape(-1, freq.size), n_bin)
+    return _as_result(((5 - beta) / 2).reshape(z.shape[:-1]))
+
+
+def psd_dimension_2d(z, n_bin=PSD_BINS):
+    """ 功率谱斜率法：表面的径向功率谱P(q)~q^(-beta)，D=(8-beta)/2
+
+    :param z: 形状为(..., ny, nx)的ndarray
+    :param n_bin: 拟合前的径向频率分组数
+    """
+    z = np.asarray(z, dtype=float)
+    ny, nx = z.shape[-2:]
+    spec = np.fft.rfft2(z - np.mean(z, axis=(-2, -1), keepdims=True))
+    fy = np.fft.fftfreq(ny)[:, np.newaxis] * ny
+    fx = np.fft.rfftfreq(nx)[np.newaxis, :] * nx
+    q = np.sqrt(fy**2 + fx**2)
+    # 只用半径不超过奈奎斯特频率、各方向完整的频率点
+    sel = (q >= 1) & (q < min(ny, nx) // 2)
+    power = spec[..., sel]
+    del spec
+    log_power = np.log(power.real**2 + power.imag**2 + np.finfo(float).tiny)
+    beta = -_log_binned_fit(q[sel], log_power.reshape(-1, log_power.shape[-1]), n_bin)
+    return _as_result(((8 - beta) / 2).reshape(z.shape[:-2]))
+
+
+def _variogram_1d(z, lags):
+    """ 沿最后一维计算变差函数 V(tau)=mean((z(x+tau)-z(x))^2)，所有延迟由一次FFT得到
+
+    sum (z[i+tau]-z[i])^2 = sum_{i<n-tau} z[i]^2 + sum_{i>=tau} z[i]^2 - 2*C(tau)，
+    其中C(tau)为补零后的自相关和。
+
+    :return: 形状为(..., lags.size)的ndarray
+    """
+    n = z.shape[-1]
+    z = z - np.mean(z, axis=-1, keepdims=True)
+    spec = np.fft.rfft(z, 2*n, axis=-1)
+    corr = np.fft.irfft(spec.real**2 + spec.imag**2, 2*n, axis=-1)[..., lags]
+    sq_cum = np.cumsum(z * z, axis=-1)
+    head = sq_cum[..., n - 1 - lags]                    # sum_{i<n-tau} z[i]^2
+    tail = sq_cum[..., -1:] - np.where(lags > 0, sq_cum[..., lags - 1], 0)   # sum_{i>=tau} z[i]^2
+    return (head + tail - 2 * corr) / (n - lags)
+
+
+def _log_lags(n, n_lag):
+    """ 1至n/8之间对数等距的整数延迟 """
+    return np.unique(np.round(np.geomspace(1, max(2, n // 8), n_lag)).astype(int))
+
+
+def variogram_dimension_1d(z, n_lag=VARIOGRAM_LAGS):
+    """ 变差函数法：V(tau)~tau^(2H)，D=2-H
+
+    :param z: 形状为(..., n)的ndarray
+    :param n_lag: 拟合所用的延迟个数
+    """
+    z = np.asarray(z, dtype=float)
+    lags = _log_lags(z.shape[-1], n_lag)
+    v = _variogram_1d(z, lags)
+    hurst = _fit_slope(np.log(lags), np.log(v)) / 2
+    return _as_result(2 - hurst)
+
+
+def variogram_dimension_2d(z, n_lag=VARIOGRAM_LAGS):
+    """ 变差函数法：沿x、y方向的平均变差函数V(tau)~tau^(2H)，D=3-H
+
+    :param z: 形状为(..., ny, nx)的ndarray
+    :param n_lag: 拟合所用的延迟个数
+    """
+    z = np.asarray(z, dtype=float)
+    lags = _log_lags(min(z.shape[-2:]), n_lag)
+    v = np.mean(_variogram_1d(z, lags), axis=-2)
+    v += np.mean(_variogram_1d(np.swapaxes(z, -1, -2), lags), axis=-2)
+    hurst = _fit_slope(np.log(lags), np.log(v)) / 2
+    return _as_result(3 - hurst)
+
+
+def _normalize_range(z, axes):
+    """ 把每个样本的高度线性变换到[0, 1] """
+    z_min = np.min(z, axis=axes, keepdims=True)
+    z_rng = np.max(z, axis=axes, keepdims=True) - z_min
+    return (z - z_min) / np.where(z_rng > 0, z_rng, 1)
+
+
+def _box_segments(n):
+    """ 盒计数法取用的采样间隔数：不超过n-1的2的幂次方 """
+    if n - 1 < MIN_BOX_SEGMENTS:
+        raise ValueError("盒计数法至少需要两种盒子尺寸，每边的采样点数应不少于{}".format(MIN_BOX_SEGMENTS + 1))
+    return 2 ** int(np.log2(n - 1))
+
+
+def box_dimension_1d(z):
+    """ 盒计数法：轮廓长度和高度范围均归一化为1，N(eps)~eps^(-D)
+
+    边长为s个采样间隔的各列的最大、最小高度由边长为s/2的相邻两列逐级归约得到，
+    相邻列共用边界点。
+
+    对采样得到的自仿射轮廓，少数几个采样点上的最大、最小高度低估了该列内的起伏，细尺度处的计数偏少，
+    估计值系统性地偏低，且分形维数越大偏差越大（8192点的DFT轮廓，D=1.2、1.5、1.8时约为1.17、1.37、1.56），
+    适合比较同一尺寸的轮廓，不宜作为D的绝对估计。
+
+    :param z: 形状为(..., n)的ndarray，n>=9
+    """
+    z = np.asarray(z, dtype=float)
+    seg = _box_segments(z.shape[-1])   # 取2的幂次方个采样间隔
+    z = _normalize_range(z[..., :seg+1], -1)
+    z_max = np.maximum(z[..., :-1], z[..., 1:])
+    z_min = np.minimum(z[..., :-1], z[..., 1:])
+    log_eps = []
+    log_cnt = []
+    s = 1
+    while seg // s >= 4:
+        eps = s / seg
+        cnt = np.sum(np.maximum(np.ceil((z_max - z_min) / eps), 1), axis=-1)
+        log_eps.append(np.log(eps))
+        log_cnt.append(np.log(cnt))
+        z_max = np.maximum(z_max[..., 0::2], z_max[..., 1::2])
+        z_min = np.minimum(z_min[..., 0::2], z_min[..., 1::2])
+        s *= 2
+    return _as_result(-_fit_slope(np.array(log_eps), np.stack(log_cnt, axis=-1)))
+
+
+def cube_dimension_2d(z):
+    """ 立方体计数法：表面边长和高度范围均归一化为1，N(eps)~eps^(-D)
+
+    每个边长为s的方格内的最大、最小高度由2x2个边长为s/2的方格逐级归约得到。
+    与box_dimension_1d相同，估计值系统性地偏低（512x512的DFT表面，D=2.2、2.5、2.8时约为2.17、2.31、2.45）。
+
+    :param z: 形状为(..., ny, nx)的ndarray，ny、nx>=9
+    """
+    z = np.asarray(z, dtype=float)
+    seg = _box_segments(min(z.shape[-2:]))
+    z = _normalize_range(z[..., :seg+1, :seg+1], (-2, -1))
+
+    def _reduce(v, func):
+        v = func(v[..., 0::2, :], v[..., 1::2, :])
+        return func(v[..., 0::2], v[..., 1::2])
+
+    z_max = np.maximum(np.maximum(z[..., :-1, :-1], z[..., 1:, :-1]), np.maximum(z[..., :-1, 1:], z[..., 1:, 1:]))
+    z_min = np.minimum(np.minimum(z[..., :-1, :-1], z[..., 1:, :-1]), np.minimum(z[..., :-1, 1:], z[..., 1:, 1:]))
+    log_eps = []
+    log_cnt = []
+    s = 1
+    while seg // s >= 4:
+        eps = s / seg
+        cnt = np.sum(np.maximum(np.ceil((z_max - z_min) / eps), 1), axis=(-2, -1))
+        log_eps.append(np.log(eps))
+        log_cnt.append(np.log(cnt))
+        z_max = _reduce(z_max, np.maximum)
+        z_min = _reduce(z_min, np.minimum)
+        s *= 2
+    return _as_result(-_fit_slope(np.array(log_eps), np.stack(log_cnt, axis=-1)))
+
+
+def _window_sizes(n):
+    """ 粗糙度-长度法的窗口宽度：MIN_WINDOW至n/4之间的2的幂次方，每种宽度至少有4个窗口 """
+    sizes = 2 ** np.arange(int(np.log2(MIN_WINDOW)), int(np.log2(n)) - 1)
+    if sizes.size < 2:
+        raise ValueError("粗糙度-长度法至少需要两种窗口宽度，每边的采样点数应不少于{}".format(MIN_WINDOW * 8))
+    return sizes
+
+
+def roughness_length_dimension_1d(z):
+    """ 粗糙度-长度法：窗口宽度w内去除线性趋势后的均方根粗糙度s(w)~w^H，D=2-H
+
+    每种窗口宽度下，把轮廓重排为(窗口数, w)的数组，一次求出全部窗口的残差方差。
+
+    :param z: 形状为(..., n)的ndarray，n>=32
+    """
+    z = np.asarray(z, dtype=float)
+    n = z.shape[-1]
+    sizes = _window_sizes(n)
+    rms = []
+    for w in sizes:
+        win = z[..., :n // w * w].reshape(z.shape[:-1] + (n // w, w))
+        x = np.arange(w) - (w - 1) / 2
+        dev = win - np.mean(win, axis=-1, keepdims=True)
+        # 线性回归的残差方差 = 方差 - 协方差^2/var(x)
+        res = np.mean(dev * dev, axis=-1) - (np.mean(dev * x, axis=-1))**2 / np.mean(x * x)
+        rms.append(np.sqrt(np.mean(res, axis=-1)))
+    hurst = _fit_slope(np.log(sizes), np.log(np.stack(rms, axis=-1)))
+    return _as_result(2 - hurst)
+
+
+def roughness_length_dimension_2d(z):
+    """ 粗糙度-长度法：wxw窗口内去除平面趋势后的均方根粗糙度s(w)~w^H，D=3-H
+
+    :param z: 形状为(..., ny, nx)的ndarray，ny、nx>=32
+    """
+    z = np.asarray(z, dtype=float)
+    ny, nx = z.shape[-2:]
+    sizes = _window_sizes(min(ny, nx))
+    rms = []
+    for w in sizes:
+        my, mx = ny // w, nx // w
+        win = z[..., :my * w, :mx * w].reshape(z.shape[:-2] + (my, w, mx, w))
+        x = np.arange(w) - (w - 1) / 2
+        dev = win - np.mean(win, axis=(-3, -1), keepdims=True)
+        # 规则网格上x、y方向的回归相互正交，残差方差 = 方差 - 两个方向的回归平方和
+        cov_y = np.mean(dev * x[:, np.newaxis, np.newaxis], axis=(-3, -1))
+        cov_x = np.mean(dev * x, axis=(-3, -1))
+        res = np.mean(dev * dev, axis=(-3, -1)) - (cov_x**2 + cov_y**2) / np.mean(x * x)
+        rms.append(np.sqrt(np.mean(res, axis=(-2, -1))))
+    hurst = _fit_slope(np.log(sizes), np.log(np.stack(rms, axis=-1)))
+    return _as_result(3 - hurst)
+
+
+_PROFILE_METHODS = {'psd': psd_dimension_1d, 'variogram': variogram_dimension_1d,
+                    'box': box_dimension_1d, 'roughness_length': roughness_length_dimension_1d}
+_SURFACE_METHODS = {'psd': psd_dimension_2d, 'variogram': variogram_dimension_2d,
+                    'box': cube_dimension_2d, 'roughness_length': roughness_length_dimension_2d}
+
+
+def profile_dimension(z, method='psd'):
+    """ 估计一条或一批轮廓的分形维数
+
+    :param z: 形状为(..., n)的ndarray
+    :param method: 'psd'、'variogram'、'box'或'roughness_length'
+    :return: float，或形状为(...)的ndarray
+    """
+    if method not in _PROFILE_METHODS:
+        raise ValueError("未知的分形维数估计方法：{}".format(method))
+    return _PROFILE_METHODS[method](z)
+
+
+def surface_dimension(z, method='psd'):
+    """ 估计一个或一批表面的分形维数
+
+    :param z: 形状为(..., ny, nx)的ndarray
+    :param method: 'psd'、'variogram'、'box'（立方体计数）或'roughness_length'
+    :return: float，或形状为(...)的ndarray
+    """
+    if method not in _SURFACE_METHODS:
+        raise ValueError("未知的分形维数估计方法：{}".format(method))
+    return _SURFACE_METHODS[method](z)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+测量数据（轮廓仪、光学形貌仪）的导入
+
+文本文件按固定大小的字节块依次读入，每块截止到最后一个换行符，剩余部分并入下一块，
+由np.loadtxt的C解析器转换，内存中只保留当前文本块和已解析的所需列。
+原始二进制网格文件以内存映射方式打开，不读入内存。
+
+导入结果为MvData2d，有坐标列时采样间隔由坐标推算。
+"""
+import io
+import warnings
+import numpy as np
+from mv2d.mv_data2d import MvData2d
+
+TEXT_CHUNK_BYTES = 16 * 2**20   # 每次读入的文本字节数
+SPACING_RTOL = 1e-3             # 判断坐标是否等间隔时允许的相对误差
+
+_DELIMITERS = bytes.maketrans(b',;\t', b'   ')
+
+
+def _text_blocks(fname, skiprows, chunk_bytes):
+    """ 依次产生以完整行结束的文本块，跳过开头的skiprows行 """
+    with open(fname, 'rb') as f:
+        for _ in range(skiprows):
+            f.readline()
+        rest = b''
+        while True:
+            block = f.read(chunk_bytes)
+            if not block:
+                break
+            block = rest + block
+            cut = block.rfind(b'\n') + 1
+            if cut == 0:
+                rest = block    # 块内没有完整的行
+                continue
+            rest = block[cut:]
+            yield block[:cut]
+        if rest.strip():
+            yield rest + b'\n'
+
+
+def read_text_columns(fname, usecols=None, skiprows=0, comments='#', chunk_bytes=TEXT_CHUNK_BYTES):
+    """ 流式读取以空白、逗号、分号或制表符分隔的数值文本
+
+    :param fname: 文件名
+    :param usecols: 需要的列号序列，为None时读取全部列
+    :param skiprows: 文件开头跳过的表头行数
+    :param comments: 注释起始字符，该字符至行尾的内容被忽略
+    :param chunk_bytes: 每次读入的字节数
+    :return: 形状为(行数, 列数)的ndarray
+    """
+    n_col = None
+    parts = []
+    for block in _text_blocks(fname, skiprows, chunk_bytes):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)   # 只含注释的块
+            values = np.loadtxt(io.BytesIO(block.translate(_DELIMITERS)), comments=comments,
+                                usecols=usecols, ndmin=2)
+        if values.size == 0:
+            continue
+        if n_col is not None and values.shape[1] != n_col:
+            raise ValueError("文本数据的列数不一致，应为{}列".format(n_col))
+        n_col = values.shape[1]
+        parts.append(values)
+    if not parts:
+        raise ValueError("文件中没有数值数据：{}".format(fname))
+    return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+
+def infer_interval(coord):
+    """ 由等间隔的坐标推算采样间隔
+
+    :param coord: 一维ndarray，单调的坐标值
+    :return: float
+    """
+    if coord.size < 2:
+        raise ValueError("至少需要两个坐标值才能推算采样间隔")
+    interval = (coord[-1] - coord[0]) / (coord.size - 1)
+    if interval == 0 or not np.allclose(np.diff(coord), interval, rtol=SPACING_RTOL, atol=0):
+        raise ValueError("坐标不是等间隔的，无法推算采样间隔")
+    return abs(interval)
+
+
+def import_profile_text(fname, x_col=0, z_col=None, interval=None, skiprows=0, comments='#',
+                        chunk_bytes=TEXT_CHUNK_BYTES) -> MvData2d:
+    """ 导入文本格式的轮廓数据
+
+    :param fname: 文件名
+    :param x_col: 坐标所在列，为None时文件中只有高度，采样间隔由interval给出
+    :param z_col: 高度所在列，为None时有坐标列则为第1列，否则为第0列
+    :param interval: 没有坐标列时的采样间隔，默认为1
+    :return: MvData2d，value为一维ndarray
+    """
+    if z_col is None:
+        z_col = 0 if x_col is None else 1
+    if x_col is None:
+        z = read_text_columns(fname, [z_col], skiprows, comments, chunk_bytes)[:, 0]
+        return MvData2d(z, 1.0 if interval is None else interval)
+    xz = read_text_columns(fname, [x_col, z_col], skiprows, comments, chunk_bytes)
+    return MvData2d(xz[:, 1].copy(), infer_interval(xz[:, 0]))
+
+
+def import_surface_xyz(fname, x_col=0, y_col=1, z_col=2, skiprows=0, comments='#',
+                       chunk_bytes=TEXT_CHUNK_BYTES) -> MvData2d:
+    """ 导入每行为一个点(x, y, z)的表面数据，点须按行（y）和列（x）顺序排列
+
+    x或y中变化较快的一个作为列方向，由慢变坐标首次改变的位置确定每行的点数。
+
+    :return: MvData2d，value为形状(行数, 列数)的ndarray
+    """
+    xyz = read_text_columns(fname, [x_col, y_col, z_col], skiprows, comments, chunk_bytes)
+    if xyz.shape[0] < 2:
+        raise ValueError("至少需要两个数据点才能确定表面的行列方向")
+    fast, slow = (0, 1) if xyz[1, 0] != xyz[0, 0] else (1, 0)
+    changed = np.nonzero(xyz[:, slow] != xyz[0, slow])[0]
+    n_col = changed[0] if changed.size else xyz.shape[0]
+    if xyz.shape[0] % n_col:
+        raise ValueError("数据点数{}不是每行点数{}的整数倍".format(xyz.shape[0], n_col))
+    grid = xyz.reshape(-1, n_col, 3)
+    inter_fast = infer_interval(grid[0, :, fast])
+    inter_slow = infer_interval(grid[:, 0, slow]) if grid.shape[0] > 1 else inter_fast
+    if not np.isclose(inter_fast, inter_slow, rtol=SPACING_RTOL):
+        raise ValueError("x、y方向的采样间隔不同：{}，{}".format(inter_fast, inter_slow))
+    z = grid[..., 2]
+    return MvData2d(z.copy() if fast == 0 else z.T.copy(), inter_fast)
+
+
+def import_surface_grid(fname, interval=1.0, skiprows=0, comments='#',
+                        chunk_bytes=TEXT_CHUNK_BYTES) -> MvData2d:
+    """ 导入每行为表面一行高度值的矩阵格式文本
+
+    :param interval: 采样间隔
+    :return: MvData2d，value为形状(行数, 列数)的ndarray
+    """
+    return MvData2d(read_text_columns(fname, None, skiprows, comments, chunk_bytes), interval)
+
+
+def import_raw(fname, shape, dtype='<f4', offset=0, interval=1.0, mmap_mode='r') -> MvData2d:
+    """ 以内存映射方式打开无格式的二进制网格文件
+
+    :param fname: 文件名
+    :param shape: 数据形状，轮廓为(n,)，表面为(行数, 列数)
+    :param dtype: 数据类型（含字节序），如'<f4'、'>i2'
+    :param offset: 数据在文件中的起始字节位置（跳过文件头）
+    :param interval: 采样间隔
+    :param mmap_mode: 内存映射模式，为None时把数据全部读入内存
+    :return: MvData2d
+    """
+    if mmap_mode is None:
+        count = int(np.prod(shape))
+        value = np.fromfile(fname, dtype=dtype, count=count, offset=offset).reshape(shape)
+    else:
+        value = np.memmap(fname, dtype=dtype, mode=mmap_mode, offset=offset, shape=tuple(shape))
+    return MvData2d(value, interval)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+幅度参数（Rq/Ra/Rsk/Rku，Sq/Sa/Ssk/Sku）的单次遍历计算
+
+数据按缓存大小的块依次读取，一次遍历同时累加|h|、h^2、h^3、h^4，
+临时数组只有块的大小，不再为整个数据生成np.power的中间结果。
+"""
+import numpy as np
+
+MOMENT_BLOCK = 2**16    # 每块的数据点数
+
+
+def moment_sums(data, block=MOMENT_BLOCK):
+    """ 分块一次遍历，计算数据点数及|h|、h^2、h^3、h^4的和
+
+    :param data: ndarray，任意维数
+    :param block: 每块的数据点数
+    :return: (点数, sum|h|, sum h^2, sum h^3, sum h^4)
+    """
+    flat = np.reshape(data, -1)
+    num = flat.size
+    buf_1 = np.empty(min(block, num), dtype=float)
+    buf_2 = np.empty(min(block, num), dtype=float)
+    s1 = s2 = s3 = s4 = 0.0
+    for i_beg in range(0, num, block):
+        blk = flat[i_beg:i_beg + block]
+        b1 = buf_1[:blk.size]
+        b2 = buf_2[:blk.size]
+        np.abs(blk, out=b1)
+        s1 += np.sum(b1)
+        np.multiply(blk, blk, out=b2)   # h^2
+        s2 += np.sum(b2)
+        np.multiply(b2, blk, out=b1)    # h^3
+        s3 += np.sum(b1)
+        np.multiply(b2, b2, out=b2)     # h^4
+        s4 += np.sum(b2)
+    return num, s1, s2, s3, s4
+
+
+def amplitude_parameters(data, block=MOMENT_BLOCK):
+    """ 一次遍历计算以零为基准的均方根偏差、算术平均偏差、偏斜度和陡度
+
+    :param data: ndarray，任意维数
+    :param block: 每块的数据点数
+    :return: (q, a, sk, ku)，分别对应Rq/Sq、Ra/Sa、Rsk/Ssk、Rku/Sku
+    """
+    num, s1, s2, s3, s4 = moment_sums(data, block)
+    return moments_to_parameters(num, s1, s2, s3, s4)
+
+
+def moments_to_parameters(num, s1, s2, s3, s4):
+    """ 由点数及|h|、h^2、h^3、h^4的和计算(q, a, sk, ku) """
+    q = np.sqrt(s2 / num)
+    a = s1 / num
+    sk = (s3 / num) / np.power(q, 3)
+    ku = (s4 / num) / np.power(q, 4)
+    return q, a, sk, ku
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+
+class MvParaCache(object):
+    """ 表征参数的缓存
+
+    缓存的参数值以数据对象及其修改计数（MvData2d.version）为前提，
+    数据对象被替换或修改后，之前缓存的全部参数值自动失效。
+    """
+    def __init__(self):
+        self.__data = None      # 缓存对应的数据对象
+        self.__version = None   # 缓存对应的数据版本
+        self.__values = {}      # 缓存键到计算结果的映射
+        self.__latest = {}      # 参数名到最近一次计算的参数值的映射
+
+    def _check(self, data):
+        if self.__data is not data or self.__version != data.version:
+            self.__data = data
+            self.__version = data.version
+            self.__values = {}
+            self.__latest = {}
+
+    def get(self, data, key, func):
+        """ 返回缓存键key对应的结果，缓存中没有时调用func()计算并存入
+
+        :param data: 数据对象，MvData2d类型
+        :param key: 缓存键，如(参数名, digits)
+        :param func: 无参数的计算函数
+        """
+        self._check(data)
+        if key not in self.__values:
+            self.__values[key] = func()
+        return self.__values[key]
+
+    def update_latest(self, data, paras: dict):
+        """ 记录最近一次计算的参数值 """
+        self._check(data)
+        self.__latest.update(paras)
+
+    def latest(self, data) -> dict:
+        """ 返回当前数据版本下已计算的参数名到参数值的映射 """
+        self._check(data)
+        return dict(self.__latest)
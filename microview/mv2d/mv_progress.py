@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+长时间计算的进度报告和取消
+
+进度回调的形式为progress(fraction, stage)，fraction为0~1之间已完成的比例，
+stage为即将开始的阶段说明。建模函数只在阶段（迭代层、傅里叶变换步骤）之间调用回调，
+回调抛出MvCancelled即可取消计算，取消在当前阶段完成后生效。
+"""
+
+
+class MvCancelled(Exception):
+    """ 计算被取消 """
+    pass
+
+
+def report(progress, fraction, stage):
+    """ progress不为None时报告进度 """
+    if progress is not None:
+        progress(fraction, stage)
+
+
+def sub_progress(progress, start, stop):
+    """ 把子计算0~1的进度映射到整体进度的[start, stop]区间
+
+    :return: 进度回调，progress为None时返回None
+    """
+    if progress is None:
+        return None
+    return lambda fraction, stage: progress(start + (stop - start) * fraction, stage)
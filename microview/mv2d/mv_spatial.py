@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+空间参数和混合参数的向量化计算
+
+自相关函数由功率谱经傅里叶逆变换得到（Wiener-Khinchin定理），补零以避免循环卷积的混叠，
+不再需要O(n^4)的直接求和；梯度由数组差分得到，按行带计算以限制临时数组的大小。
+"""
+import numpy as np
+
+ACF_THRESHOLD = 0.2     # 计算自相关长度时自相关函数的衰减阈值s
+GRADIENT_BLOCK = 2**20  # 按行带计算梯度时每带的数据点数
+TEXTURE_MIN_RING = 3    # 计算纹理方向时的最小频率半径（以频率间隔计）
+TEXTURE_REFINE_DEG = 10 # 修正纹理方向峰值时取用的角度范围（度）
+
+
+def acf_1d(z):
+    """ 计算轮廓的归一化自相关函数，只返回非负延迟部分
+
+    :param z: 一维ndarray，轮廓高度
+    :return: 一维ndarray，acf[k]为延迟k个采样间隔时的自相关系数，acf[0]=1
+    """
+    z = np.asarray(z, dtype=float)
+    n = z.size
+    spec = np.fft.rfft(z - np.mean(z), 2*n)
+    acf = np.fft.irfft(spec.real**2 + spec.imag**2, 2*n)[:n]
+    acf /= acf[0]
+    return acf
+
+
+def acf_2d(z):
+    """ 计算表面的归一化自相关函数
+
+    :param z: 二维ndarray，表面高度
+    :return: 形状为(2*ny, 2*nx)的ndarray，acf[i % (2*ny), j % (2*nx)]为延迟(i, j)个采样间隔时的
+             自相关系数（i、j可为负数），acf[0, 0]=1
+    """
+    z = np.asarray(z, dtype=float)
+    ny, nx = z.shape
+    spec = np.fft.rfft2(z - np.mean(z), s=(2*ny, 2*nx))
+    np.multiply(spec, np.conj(spec), out=spec)
+    acf = np.fft.irfft2(spec, s=(2*ny, 2*nx))
+    del spec
+    acf /= acf[0, 0]
+    return acf
+
+
+def decay_length_1d(acf, interval, s=ACF_THRESHOLD):
+    """ 自相关函数首次衰减到s以下时的延迟距离，在相邻两点间线性插值
+
+    :return: float，自相关函数始终大于s时为np.inf
+    """
+    below = np.nonzero(acf <= s)[0]
+    if below.size == 0:
+        return np.inf
+    k = below[0]
+    frac = (acf[k-1] - s) / (acf[k-1] - acf[k])
+    return (k - 1 + frac) * interval
+
+
+def decay_lengths_2d(acf, interval, s=ACF_THRESHOLD, n_dir=360):
+    """ 沿各方向计算表面自相关函数首次衰减到s以下时的距离
+
+    沿n_dir条从零延迟点出发的射线，以双线性插值对自相关函数采样，所有方向同时计算。
+
+    :param acf: acf_2d的返回值，零延迟位于[0, 0]
+    :param interval: 采样间隔
+    :param s: 衰减阈值
+    :param n_dir: 方向数，方向均匀分布在[0, pi)内（自相关函数中心对称）
+    :return: 一维ndarray，各方向的衰减距离，在数据范围内未衰减到s以下的方向为np.inf
+    """
+    ny = acf.shape[0] // 2
+    nx = acf.shape[1] // 2
+    theta = np.arange(n_dir) * np.pi / n_dir
+    r = np.arange(0, min(ny, nx) - 1, 0.5)     # 以半个采样间隔为步长
+    py = np.outer(np.sin(theta), r)
+    px = np.outer(np.cos(theta), r)
+    y0 = np.floor(py).astype(int)
+    x0 = np.floor(px).astype(int)
+    wy = py - y0
+    wx = px - x0
+    # 负延迟按acf的周期排列取模
+    y1 = (y0 + 1) % acf.shape[0]
+    x1 = (x0 + 1) % acf.shape[1]
+    y0 %= acf.shape[0]
+    x0 %= acf.shape[1]
+    val = (acf[y0, x0] * (1-wy) * (1-wx) + acf[y1, x0] * wy * (1-wx) +
+           acf[y0, x1] * (1-wy) * wx + acf[y1, x1] * wy * wx)
+
+    below = val <= s
+    found = below.any(axis=1)
+    k = np.argmax(below, axis=1)
+    k = np.maximum(k, 1)
+    rows = np.arange(n_dir)
+    v0 = val[rows, k-1]
+    v1 = val[rows, k]
+    frac = (v0 - s) / np.where(v0 != v1, v0 - v1, 1)
+    dist = (r[k-1] + frac * (r[k] - r[k-1])) * interval
+    dist[~found] = np.inf
+    return dist
+
+
+def texture_direction(z, n_bin=360, min_ring=TEXTURE_MIN_RING, refine=TEXTURE_REFINE_DEG):
+    """ 由角功率谱计算表面纹理方向Std（度）
+
+    表面乘以二维Hann窗后求功率谱，消除边界不连续沿坐标轴方向的频谱泄漏。
+    功率谱以双线性插值重采样到极坐标网格上，每个方向在min_ring至min(nx, ny)/2的圆环内
+    按半径加权求和，各方向的采样点数相同，不受方形频率网格在坐标轴和对角线方向的疏密影响；
+    最内几个圆环只有少数几个方向，不参与计算。
+    由角功率谱的峰值得到初值，再以峰值两侧refine度内各频率点的功率加权平均修正，
+    功率最大的频率方向与纹理方向垂直。
+
+    :param z: 二维ndarray，表面高度
+    :param n_bin: 角度分组数
+    :param min_ring: 参与计算的最小频率半径（以频率间隔计）
+    :param refine: 修正峰值时取用的角度范围（度），为0时不修正
+    :return: float，纹理方向与x轴的夹角，单位为度，范围[0, 180)
+    """
+    z = np.asarray(z, dtype=float)
+    ny, nx = z.shape
+    m = min(nx, ny)
+    spec = np.fft.rfft2((z - np.mean(z)) * np.outer(np.hanning(ny), np.hanning(nx)))
+    power = spec.real**2 + spec.imag**2
+    del spec
+
+    # 极坐标网格，半径以较短一边的频率间隔计；fx<0的方向由共轭对称折回fx>=0的半平面
+    theta = (np.arange(n_bin) + 0.5) * np.pi / n_bin
+    r = np.arange(min_ring, m / 2 + 0.25, 0.5)
+    kx = np.outer(np.cos(theta), r) * (nx / m)
+    ky = np.outer(np.sin(theta), r) * (ny / m)
+    ky[kx < 0] *= -1
+    np.abs(kx, out=kx)
+    x0 = np.floor(kx).astype(int)
+    y0 = np.floor(ky).astype(int)
+    wx = kx - x0
+    wy = ky - y0
+    x1 = np.minimum(x0 + 1, power.shape[1] - 1)
+    y1 = (y0 + 1) % ny
+    y0 %= ny
+    val = (power[y0, x0] * (1-wy) * (1-wx) + power[y1, x0] * wy * (1-wx) +
+           power[y0, x1] * (1-wy) * wx + power[y1, x1] * wy * wx)
+    ang_power = val @ r
+    peak = (np.argmax(ang_power) + 0.5) * 180 / n_bin
+
+    if refine > 0:
+        fy = np.fft.fftfreq(ny)[:, np.newaxis] * m
+        fx = np.fft.rfftfreq(nx)[np.newaxis, :] * m
+        q = np.hypot(fx, fy)
+        diff = (np.degrees(np.arctan2(fy, fx)) - peak + 90) % 180 - 90
+        # fx>0的每个点代表共轭的一对点，fx=0和Nyquist列上的点已成对出现
+        weight = np.where((fx > 0) & (fx < m / 2), 2.0, 1.0) * power
+        near = (q >= min_ring) & (q <= m / 2) & (np.abs(diff) <= refine)
+        w_sum = np.sum(weight[near])
+        if w_sum > 0:
+            peak += np.sum(weight[near] * diff[near]) / w_sum
+    return (peak + 90) % 180
+
+
+def gradient_parameters_2d(z, interval, block=GRADIENT_BLOCK):
+    """ 按行带计算表面的均方根梯度Sdq和界面扩展面积比Sdr
+
+    x、y方向的梯度由相邻点的前向差分得到，在(ny-1)x(nx-1)个网格单元上计算。
+
+    :param z: 二维ndarray，表面高度
+    :param interval: 采样间隔
+    :param block: 每个行带的数据点数
+    :return: (Sdq, Sdr)，Sdr以百分数表示
+    """
+    ny, nx = z.shape
+    band = max(1, block // nx)
+    g2_sum = 0.0
+    area_sum = 0.0
+    for r_beg in range(0, ny - 1, band):
+        r_end = min(r_beg + band, ny - 1)
+        rows = np.asarray(z[r_beg:r_end+1], dtype=float)
+        gx = np.diff(rows[:-1], axis=1) / interval
+        gy = np.diff(rows[:, :-1], axis=0) / interval
+        g2 = gx * gx
+        g2 += gy * gy
+        g2_sum += np.sum(g2)
+        g2 += 1
+        area_sum += np.sum(np.sqrt(g2, out=g2))
+    num = (ny - 1) * (nx - 1)
+    sdq = np.sqrt(g2_sum / num)
+    sdr = (area_sum / num - 1) * 100
+    return sdq, sdr
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+建模、参数计算和绘图各阶段的耗时跟踪
+
+跟踪默认关闭，此时span()返回同一个空操作对象，traced()直接返回原函数，
+被跟踪的代码只多一次函数调用和一次判断。开启后每个阶段记录为一个事件
+（名称、开始时间、持续时间、线程、新分配数组的字节数），可汇总为一行文字显示在状态栏，
+或导出为Chrome跟踪格式（chrome://tracing、Perfetto可打开）的json文件离线分析。
+只记录当前进程中的事件，进程池中生成的样本不计入。
+
+用法：
+    with span('_surf_dft.fill') as sp:
+        coef = np.zeros(...)
+        sp.add_bytes(coef.nbytes)
+"""
+import collections
+import json
+import os
+import threading
+import time
+
+TRACE_CAPACITY = 100000     # 保留的事件数上限，超出时丢弃最早的事件
+
+MvTraceEvent = collections.namedtuple('MvTraceEvent', ['name', 'start', 'duration', 'tid', 'nbytes'])
+MvTraceEvent.__doc__ = """ 跟踪事件，start、duration的单位为纳秒（time.perf_counter_ns） """
+
+_enabled = False
+_events = collections.deque(maxlen=TRACE_CAPACITY)
+
+
+class _NullSpan(object):
+    """ 跟踪关闭时的空操作阶段，所有span()调用共用一个实例 """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_bytes(self, nbytes):
+        pass
+
+
+class _Span(object):
+    """ 跟踪开启时记录一个阶段的起止时间 """
+    __slots__ = ('name', 'nbytes', '_start')
+
+    def __init__(self, name):
+        self.name = name
+        self.nbytes = 0
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        _events.append(MvTraceEvent(self.name, self._start, end - self._start, threading.get_ident(),
+                                    self.nbytes))
+        return False
+
+    def add_bytes(self, nbytes):
+        """ 记录本阶段新分配的数组字节数，可多次调用累加 """
+        self.nbytes += int(nbytes)
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def enable(flag=True):
+    """ 开启或关闭跟踪 """
+    global _enabled
+    _enabled = bool(flag)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def clear():
+    """ 清除已记录的事件 """
+    _events.clear()
+
+
+def now() -> int:
+    """ 当前时间（纳秒），可作为events(since)的起点 """
+    return time.perf_counter_ns()
+
+
+def span(name):
+    """ 返回记录阶段name的上下文管理器，跟踪关闭时为空操作
+
+    :param name: 阶段名称，以'.'分隔的第一段作为Chrome跟踪的类别
+    """
+    return _Span(name) if _enabled else _NULL_SPAN
+
+
+def traced(name, func):
+    """ 返回在阶段name中调用func的函数，跟踪关闭时直接返回func
+
+    :param name: 阶段名称
+    :param func: 被跟踪的函数
+    """
+    if not _enabled:
+        return func
+
+    def _traced(*args, **kwargs):
+        with _Span(name):
+            return func(*args, **kwargs)
+    return _traced
+
+
+def events(since=None) -> list:
+    """ 返回已记录的事件，按结束时间排序
+
+    :param since: 为None时返回全部事件，否则只返回开始时间不早于since（now()的返回值）的事件
+    """
+    evts = list(_events)
+    if since is None:
+        return evts
+    return [e for e in evts if e.start >= since]
+
+
+def summarize(evts) -> list:
+    """ 按阶段名称汇总事件
+
+    :return: 列表，每项为(名称, 总耗时（秒）, 次数, 分配字节数)，按各阶段首次开始的时间排序
+    """
+    first = {}
+    total = collections.defaultdict(lambda: [0, 0, 0])
+    for e in evts:
+        first[e.name] = min(first.get(e.name, e.start), e.start)
+        item = total[e.name]
+        item[0] += e.duration
+        item[1] += 1
+        item[2] += e.nbytes
+    return [(name, total[name][0] * 1e-9, total[name][1], total[name][2])
+            for name in sorted(first, key=first.get)]
+
+
+def format_summary(evts) -> str:
+    """ 把事件汇总为一行文字，用于状态栏显示 """
+    parts = []
+    for name, sec, count, nbytes in summarize(evts):
+        text = '{} {:.1f} ms'.format(name, sec * 1e3)
+        if count > 1:
+            text += ' ×{}'.format(count)
+        if nbytes:
+            text += ' {:.1f} MB'.format(nbytes / 2**20)
+        parts.append(text)
+    return ' | '.join(parts)
+
+
+def export_chrome_trace(fname, evts=None):
+    """ 把事件写为Chrome跟踪格式的json文件
+
+    :param fname: 结果文件名
+    :param evts: 事件列表，为None时导出全部已记录的事件
+    :return: 写入的事件数
+    """
+    evts = events() if evts is None else evts
+    pid = os.getpid()
+    trace = [{'name': e.name, 'cat': e.name.split('.')[0], 'ph': 'X', 'ts': e.start / 1e3,
+              'dur': e.duration / 1e3, 'pid': pid, 'tid': e.tid, 'args': {'bytes': e.nbytes}}
+             for e in evts]
+    with open(fname, 'w') as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+    return len(trace)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+图形界面的后台计算
+
+MvJobRunner在线程池中执行建模和参数计算，界面线程保持响应。任务为函数func(progress)，
+progress(fraction, stage)报告进度并检查取消标志，任务被取消时由progress抛出MvCancelled。
+工作线程通过Qt信号把进度和结果交回界面线程（跨线程的信号自动排队），绘图只在界面线程中进行。
+提交新任务时取消正在执行的任务，旧任务在下一个进度检查点停止，其迟到的结果被丢弃。
+"""
+import threading
+from PySide2.QtCore import QObject, QRunnable, QThreadPool, Signal
+from mv2d.mv_progress import MvCancelled
+
+
+class _JobSignals(QObject):
+    """ 工作线程发出的信号，参数的第一项为任务序号 """
+    progress = Signal(int, float, str)
+    finished = Signal(int, object)
+    failed = Signal(int, str)
+    cancelled = Signal(int)
+
+
+class _Job(QRunnable):
+    def __init__(self, job_id, func, signals):
+        super().__init__()
+        self.setAutoDelete(False)   # 由MvJobRunner持有，直到任务结束
+        self.job_id = job_id
+        self.func = func
+        self.signals = signals
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _progress(self, fraction, stage):
+        if self._cancel.is_set():
+            raise MvCancelled()
+        self.signals.progress.emit(self.job_id, fraction, stage)
+
+    def run(self):
+        try:
+            self._progress(0.0, "开始")
+            result = self.func(self._progress)
+        except MvCancelled:
+            self.signals.cancelled.emit(self.job_id)
+        except Exception as e:
+            self.signals.failed.emit(self.job_id, str(e))
+        else:
+            self.signals.finished.emit(self.job_id, result)
+
+
+class MvJobRunner(QObject):
+    """ 在线程池中执行任务，同一时刻只有最近提交的任务有效
+    """
+    progress = Signal(float, str)   # 已完成的比例，当前阶段
+    finished = Signal(object)       # 任务的返回值
+    failed = Signal(str)            # 错误信息
+    cancelled = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # 被取消的任务可能仍在完成当前阶段，留出第二个线程使新任务立即开始
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self._signals = _JobSignals(self)
+        self._signals.progress.connect(self._on_progress)
+        self._signals.finished.connect(self._on_finished)
+        self._signals.failed.connect(self._on_failed)
+        self._signals.cancelled.connect(self._on_cancelled)
+        self._jobs = {}     # 尚未结束的任务（含已被取代的），任务序号到任务的映射
+        self._job_id = 0    # 最近提交的任务序号
+
+    def submit(self, func):
+        """ 提交任务func(progress)，取代正在执行的任务
+
+        :return: 任务序号
+        """
+        self.cancel()
+        self._job_id += 1
+        job = _Job(self._job_id, func, self._signals)
+        self._jobs[self._job_id] = job
+        self.pool.start(job)
+        return self._job_id
+
+    def cancel(self):
+        """ 请求取消当前任务 """
+        if self._job_id in self._jobs:
+            self._jobs[self._job_id].cancel()
+
+    def is_running(self) -> bool:
+        return self._job_id in self._jobs
+
+    def wait(self, msecs=-1):
+        """ 等待线程池中的全部任务结束（关闭窗口时使用） """
+        return self.pool.waitForDone(msecs)
+
+    def _end(self, job_id):
+        """ 任务结束，返回是否为最近提交的任务 """
+        self._jobs.pop(job_id, None)
+        return job_id == self._job_id
+
+    def _on_progress(self, job_id, fraction, stage):
+        if job_id == self._job_id and job_id in self._jobs:
+            self.progress.emit(fraction, stage)
+
+    def _on_finished(self, job_id, result):
+        if self._end(job_id):
+            self.finished.emit(result)
+
+    def _on_failed(self, job_id, message):
+        if self._end(job_id):
+            self.failed.emit(message)
+
+    def _on_cancelled(self, job_id):
+        if self._end(job_id):
+            self.cancelled.emit()
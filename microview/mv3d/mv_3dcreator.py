@@ -1,9 +1,159 @@
 # -*- coding: utf-8 -*-
+import functools
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib import cm
-from mpl_toolkits.mplot3d import Axes3D
 from mv2d.mv_data2d import MvData2d
+from mv2d.mv_datafile import load_data, npy_name, save_data, save_meta
+from mv2d.mv_ensemble import draw_stacked, create_ensemble
+from mv2d.mv_progress import report, sub_progress
+from mv2d.mv_trace import span, traced
+from mv3d.mv_3dtiled import SURF_MEM_BUDGET, create_surf_dft_file, create_surf_rmd_file
+
+
+@functools.lru_cache(maxsize=128)
+def _get_spectrum_power_sum(n, d):
+    """ 计算 sum_{u=1}^{n/2-1} sum_{v=0}^{n/2-1} (u^2+v^2)^(d-4)
+
+    求和只与n和d有关，结果在进程内缓存，相同分辨率和分形维数的重复建模不再重新计算。
+    按行分块求和，每块不超过约2^20个元素。
+    """
+    i_v = np.arange(0, n//2, dtype=float)**2
+    blk = max(1, 2**20 // max(i_v.size, 1))
+    temp_sum = 0.0
+    for u_beg in range(1, n//2, blk):
+        i_u = np.arange(u_beg, min(u_beg + blk, n//2), dtype=float)**2
+        r2 = np.add.outer(i_u, i_v)
+        temp_sum += np.sum(np.power(r2, d-4, out=r2))
+    return temp_sum
+
+
+def _set_polar(out, mag, phase):
+    """ 将幅值为mag、相位为phase的复数写入复数数组out
+    """
+    out.real = mag * np.cos(phase)
+    out.imag = mag * np.sin(phase)
+
+
+def _surf_rmd(n, d, sa, rngs, progress=None):
+    """ 用随机中点位移法（diamond-square）生成分形表面
+
+    :param n: 采样点数，数值应为2的幂次方
+    :param d: 分形维数
+    :param sa: 构建表面的Sa值
+    :param rngs: 随机源序列，每个表面一个
+    :param progress: 进度回调，每层迭代前调用一次，见mv2d.mv_progress
+    :return: 形状为(len(rngs), n, n)的ndarray
+    """
+    lev = int(np.log2(n))
+    surf = np.zeros((len(rngs), n+1, n+1))
+    st_dev = 1
+    stp = n // 2
+    hurst = 3 - d
+    # 初始化四个角点的坐标值
+    corner = st_dev * draw_stacked(rngs, 'standard_normal', size=4)
+    surf[:, 0, 0] = corner[:, 0]
+    surf[:, 0, n] = corner[:, 1]
+    surf[:, n, 0] = corner[:, 2]
+    surf[:, n, n] = corner[:, 3]
+    # 每层迭代在步长为stp的格点视图上进行：行列序号均为奇数的点为菱形中心，
+    # 行列序号奇偶性不同的点为正方形中心（含边界点），其余点在之前的迭代中已确定
+    for lv in range(lev):
+        report(progress, lv / (lev+1), "随机中点位移：第{}/{}层".format(lv+1, lev))
+        st_dev = st_dev * np.power(0.5, 0.5*hurst)
+        grid = surf[:, ::stp, ::stp]
+        m = n // stp    # 当前格点视图每边的区间数
+        h = m // 2
+
+        # 菱形步：中心点取四个角点的均值
+        ctr = grid[:, 1::2, 1::2]
+        np.add(grid[:, 0:-1:2, 0:-1:2], grid[:, 2::2, 0:-1:2], out=ctr)
+        ctr += grid[:, 0:-1:2, 2::2]
+        ctr += grid[:, 2::2, 2::2]
+        ctr *= 0.25
+        ctr += st_dev * draw_stacked(rngs, 'standard_normal', size=(h, h))
+
+        # 正方形步：偶数行奇数列的点edge_r，奇数行偶数列的点edge_c，
+        # 取上下左右已知点的均值，位于表面边界上的点只有三个相邻点
+        edge_r = grid[:, 0::2, 1::2]
+        np.add(grid[:, 0::2, 0:-1:2], grid[:, 0::2, 2::2], out=edge_r)
+        edge_r[:, 1:] += ctr
+        edge_r[:, :-1] += ctr
+        edge_r[:, 1:-1] *= 0.25
+        edge_r[:, [0, -1]] /= 3
+
+        edge_c = grid[:, 1::2, 0::2]
+        np.add(grid[:, 0:-1:2, 0::2], grid[:, 2::2, 0::2], out=edge_c)
+        edge_c[:, :, 1:] += ctr
+        edge_c[:, :, :-1] += ctr
+        edge_c[:, :, 1:-1] *= 0.25
+        edge_c[:, :, [0, -1]] /= 3
+
+        # 随机数按格点的行优先顺序抽取：偶数行为edge_r中的点，奇数行为edge_c中的点
+        noise = st_dev * draw_stacked(rngs, 'standard_normal', size=h*(m+2))
+        noise_pair = noise[:, :h*(m+1)].reshape(-1, h, m+1)
+        edge_r[:, :-1] += noise_pair[:, :, :h]
+        edge_r[:, -1] += noise[:, h*(m+1):]
+        edge_c += noise_pair[:, :, h:]
+
+        stp = stp // 2
+
+    # 使表面的平均高度为0
+    report(progress, lev / (lev+1), "调整表面高度")
+    surf = surf[:, 0:n, 0:n]
+    h_mean = np.mean(surf, axis=(1, 2), keepdims=True)
+    surf = surf - h_mean
+    sa_surf = np.round(np.mean(np.abs(surf), axis=(1, 2), keepdims=True), 4)
+    sa = np.round(sa, 4)
+    ratio = sa / sa_surf
+    surf *= ratio
+    return surf
+
+
+def _surf_dft(n, mag, mag_axis, stable, rngs, progress=None):
+    """ 由幅值包络生成DFT分形表面
+
+    :param n: 采样点数，可以为奇数（此时n//2列没有对应的Nyquist频率，其系数为0）
+    :param mag: 形状为(n/2-1, n/2-1)的ndarray，频率索引(u, v)，u, v = 1..n/2-1处的幅值
+    :param mag_axis: 一维ndarray，坐标轴上(u, 0)和(0, v)处的幅值
+    :param stable: 是否生成平稳分形表面
+    :param rngs: 随机源序列，每个表面一个
+    :param progress: 进度回调，每个步骤前调用一次，见mv2d.mv_progress
+    :return: 形状为(len(rngs), n, n)的ndarray
+    """
+    m = n//2 - 1
+    report(progress, 0.0, "抽取随机相位")
+    with span('_surf_dft.random') as sp:
+        # 随机相位一次性抽取，phase[:, u, v, 0]对应(u, v)，phase[:, u, v, 1]对应(u, n-v)
+        phase = draw_stacked(rngs, 'uniform', 0, 2 * np.pi, size=(m, m, 2))
+        phase_axis = draw_stacked(rngs, 'uniform', 0, 2 * np.pi, size=(m, 2))
+        sp.add_bytes(phase.nbytes + phase_axis.nbytes)
+        if stable:
+            mag1 = mag2 = mag
+            mag_u = mag_v = mag_axis
+        else:
+            rnd = draw_stacked(rngs, 'standard_normal', size=(m, m, 2))
+            rnd_axis = draw_stacked(rngs, 'standard_normal', size=(m, 2))
+            mag1 = rnd[..., 0] * mag
+            mag2 = rnd[..., 1] * mag
+            mag_u = rnd_axis[..., 0] * mag_axis
+            mag_v = rnd_axis[..., 1] * mag_axis
+            sp.add_bytes(2 * (rnd.nbytes + rnd_axis.nbytes))
+
+    # 实表面的傅里叶系数共轭对称，只需构造v = 0..n/2的半平面，由二维实逆变换得到表面
+    report(progress, 0.3, "填充傅里叶系数")
+    with span('_surf_dft.fill') as sp:
+        fs_coef = np.zeros((len(rngs), n, n//2 + 1), dtype=complex)
+        sp.add_bytes(fs_coef.nbytes)
+        _set_polar(fs_coef[:, 1:n//2, 1:n//2], mag1, phase[..., 0])
+        _set_polar(fs_coef[:, n-1:n-1-m:-1, 1:n//2], mag2, -phase[..., 1])    # (n-u, v) = conj((u, n-v))
+        _set_polar(fs_coef[:, 1:n//2, 0], mag_u, phase_axis[..., 0])
+        _set_polar(fs_coef[:, n-1:n-1-m:-1, 0], mag_u, -phase_axis[..., 0])
+        _set_polar(fs_coef[:, 0, 1:n//2], mag_v, phase_axis[..., 1])
+
+    report(progress, 0.5, "二维傅里叶逆变换")
+    with span('_surf_dft.irfft2') as sp:
+        surf = np.fft.irfft2(fs_coef, s=(n, n))
+        sp.add_bytes(surf.nbytes)
+    return surf
 
 
 class Mv3dCreator(object):
@@ -12,123 +162,122 @@ class Mv3dCreator(object):
     def __init__(self):
         self.data = MvData2d()
 
-    def create_surf_rmd(self, n:int, d:float, sa:float, si:float):
+    def create_surf_rmd(self, n:int, d:float, sa:float, si:float, progress=None):
         """ 基于随机中点位移法创建分形表面
 
         :param n: 采样点数，数值应为2的幂次方
         :param d: 分形维数，2<d<3
         :param si: 采样间隔
         :param sa: 构建表面的Sa值
+        :param progress: 进度回调progress(fraction, stage)，抛出异常可取消建模，见mv2d.mv_progress
         """
-        lev = int(np.log2(n))
-        surf = np.zeros((n+1, n+1))
-        st_dev = 1
-        stp = n // 2
-        hurst = 3 - d
-        # 初始化四个角点的坐标值
-        surf[0, 0] = st_dev * np.random.normal()
-        surf[0, n] = st_dev * np.random.normal()
-        surf[n, 0] = st_dev * np.random.normal()
-        surf[n, n] = st_dev * np.random.normal()
-        #
-        for lv in range(lev):
-
-            st_dev = st_dev * np.power(0.5, 0.5*hurst)
-            for i in range(stp, n, 2*stp):
-                for j in range(stp, n, 2*stp):
-                    surf[i, j] = self._avg_4(st_dev, surf[i-stp, j-stp], surf[i+stp, j-stp],
-                                             surf[i-stp, j+stp], surf[i+stp, j+stp])
-            for i in range(0, n+1, stp):
-                for j in range(0, n+1, stp):
-                    if np.fabs(surf[i,j]) > 0.00001 :
-                        continue
-                    if i == 0:
-                        surf[i, j] = self._avg_3(st_dev, surf[i, j-stp], surf[stp, j], surf[i, j+stp])
-                    elif i == n:
-                        surf[i, j] = self._avg_3(st_dev, surf[n, j-stp], surf[n-stp, j], surf[n, j+stp])
-                    elif j == 0:
-                        surf[i, j] = self._avg_3(st_dev, surf[i-stp, j], surf[i, stp], surf[i+stp, j])
-                    elif j == n:
-                        surf[i, j] = self._avg_3(st_dev, surf[i-stp, j], surf[i, n-stp], surf[i+stp, n])
-                    else:
-                        surf[i, j] = self._avg_4(st_dev, surf[i, j-stp], surf[i, j+stp],
-                                             surf[i-stp, j], surf[i+stp, j])
-            stp = stp // 2
-
-        # 使表面的平均高度为0
-        surf = surf[0:n, 0:n]
-        h_mean = np.mean(surf)
-        surf = surf - h_mean
-        sa_surf = np.round(np.mean(np.abs(surf)),4)
-        sa = np.round(sa, 4)
-        ratio = sa / sa_surf
-        surf = surf * ratio
-
-        self.data.value = surf
+        sampler = self._sampler_rmd(n, d, sa, si)
+        self.data.value = traced('_surf_rmd', sampler)([np.random], progress=progress)[0]
         self.data.interval = si
+        self.data.set_meta(method='rmd', d=d, target=sa)
 
+    def create_surf_dft(self, n, d, sq, inter, stable=True, progress=None):
+        """ 基于离散傅里叶逆变换创建分形表面
 
-    def _avg_4(self, st_dev, f1, f2, f3, f4):
-        val = (f1+f2+f3+f4)/4 + st_dev * np.random.normal()
-        return val
+        :param n: 采样点数，数值应为2的幂次方
+        :param d: 分形维数，2<d<3
+        :param sq: 表面采样点高度均方根偏差的期望值
+        :param inter: 表面采样间隔，存储在表面数据中，建模时不使用
+        :param stable: 是否生成平稳分形表面
+        :param progress: 进度回调progress(fraction, stage)，抛出异常可取消建模，见mv2d.mv_progress
+        """
+        report(progress, 0.0, "计算尺度系数和幅值包络")
+        sampler = self._sampler_dft(n, d, sq, inter, stable)
+        self.data.value = sampler([np.random], progress=sub_progress(progress, 0.1, 1.0))[0]
+        self.data.interval = inter
+        self.data.set_meta(method='dft', d=d, target=sq)
 
-    def _avg_3(self, st_dev, f1, f2, f3):
-        val = (f1+f2+f3)/3 + st_dev * np.random.normal()
-        return val
+    def create_surf_rmd_file(self, fname, n, d, sa, si, mem_budget=SURF_MEM_BUDGET, seed=None):
+        """ 基于随机中点位移法分块创建分形表面，结果写入内存映射的.npy文件及.json附属文件
 
+        :param fname: 结果文件名，没有.npy扩展名时自动补足
+        :param n: 采样点数，数值应为2的幂次方
+        :param d: 分形维数，2<d<3
+        :param sa: 构建表面的Sa值
+        :param si: 采样间隔
+        :param mem_budget: 内存中数据块的上限（字节）
+        :param seed: 随机数种子，为None时使用全局随机状态
+        """
+        fname = npy_name(fname)
+        self.data.value = create_surf_rmd_file(fname, n, d, sa, mem_budget, seed)
+        self.data.interval = si
+        self.data.set_meta(method='rmd', d=d, target=sa, seed=seed)
+        save_meta(fname, self.data)
 
-    def create_surf_dft(self, n, d, sq, inter, stable=True):
-        """ 基于离散傅里叶逆变换创建分形表面
+    def create_surf_dft_file(self, fname, n, d, sq, inter, stable=True, mem_budget=SURF_MEM_BUDGET,
+                             seed=None):
+        """ 基于离散傅里叶逆变换分块创建分形表面，结果写入内存映射的.npy文件及.json附属文件
 
+        :param fname: 结果文件名，没有.npy扩展名时自动补足
         :param n: 采样点数，数值应为2的幂次方
         :param d: 分形维数，2<d<3
         :param sq: 表面采样点高度均方根偏差的期望值
-        :param inter: 表面采样间隔，存储在表面数据中，建模时不使用
+        :param inter: 表面采样间隔
         :param stable: 是否生成平稳分形表面
+        :param mem_budget: 内存中数据块的上限（字节）
+        :param seed: 随机数种子，为None时使用全局随机状态
+        """
+        sqrt_coef = np.sqrt(self._get_fractal_cof_from_sq(n, d, sq))
+        fname = npy_name(fname)
+        self.data.value = create_surf_dft_file(fname, n, d, sqrt_coef, stable, mem_budget, seed)
+        self.data.interval = inter
+        self.data.set_meta(method='dft', d=d, target=sq, seed=seed)
+        save_meta(fname, self.data)
+
+    def create_ensemble(self, k: int, method: str, *args, chunk_size=None, seed=None, workers=None,
+                        **kwargs):
+        """ 用同一组参数一次生成k个分形表面，不改变self.data
+
+        与随机数无关的部分（DFT的尺度系数和幅值包络）只计算一次，
+        各表面的二维傅里叶逆变换沿第0轴批量进行。
+        给定seed或workers时，每个表面使用由seed派生的独立随机数流，可用进程池并行生成，
+        相同的seed在任意进程数下得到逐位相同的结果。
+
+        :param k: 表面个数
+        :param method: 建模算法，'dft'或'rmd'
+        :param args: 与对应的create_surf_dft、create_surf_rmd方法的参数相同
+        :param chunk_size: 为None时返回形状为(k, n, n)的ndarray；
+                           否则返回迭代器，每次产生至多chunk_size个表面
+        :param seed: 随机数种子，为None且workers为None时使用全局随机状态
+        :param workers: 并行生成的进程数，为None或1时在当前进程中生成
+        :param kwargs: 与对应的create_surf_*方法的关键字参数相同
         """
-        fractal_coef = self._get_fractal_cof_from_sq(n, d, sq)
-        fs_coef = np.zeros((n, n), dtype=complex)
+        return create_ensemble(self._get_sampler(method, *args, **kwargs), k, chunk_size, seed, workers)
 
+    def _get_sampler(self, method, *args, **kwargs):
+        samplers = {'dft': self._sampler_dft, 'rmd': self._sampler_rmd}
+        if method not in samplers:
+            raise ValueError("未知的建模算法：{}".format(method))
+        return samplers[method](*args, **kwargs)
+
+    def _sampler_rmd(self, n, d, sa, si):
+        """ 返回随机中点位移法的采样函数，参数同create_surf_rmd
+        """
+        assert n >= 2 and np.log2(n).is_integer(), "输入的采样点数不是2的幂次方，程序退出"
+        return functools.partial(_surf_rmd, n, d, sa)
+
+    def _sampler_dft(self, n, d, sq, inter, stable=True):
+        """ 返回离散傅里叶逆变换法的采样函数，参数同create_surf_dft
+        """
+        with span('Mv3dCreator._get_fractal_cof_from_sq'):
+            fractal_coef = self._get_fractal_cof_from_sq(n, d, sq)
         sqrt_coef = np.sqrt(fractal_coef)
 
-        for u in range(1, n//2):
-            for v in range(1, n//2):
-                phase1 = np.random.uniform(0, 2 * np.pi)
-                phase2 = np.random.uniform(0, 2 * np.pi)
-                if stable:
-                    mag1 = sqrt_coef * np.power(u**2 + v**2, (d-4)/2)
-                    mag2 = mag1
-                else:
-                    mag1 = np.random.randn() * sqrt_coef * np.power(u**2 + v**2, (d-4)/2)
-                    mag2 = np.random.randn() * sqrt_coef * np.power(u**2 + v**2, (d-4)/2)
-
-                value_1 = np.complex(mag1 * np.cos(phase1), mag1 * np.sin(phase1))
-                value_2 = np.complex(mag2 * np.cos(phase2), mag2 * np.sin(phase2))
-                fs_coef[u, v] = value_1
-                fs_coef[n-u, n-v] = np.conj(value_1)
-                fs_coef[u, n-v] = value_2
-                fs_coef[n-u, v] = np.conj(value_2)
-
-        for i in range(1, n//2):
-            phase_u = np.random.uniform(0, 2 * np.pi)
-            phase_v = np.random.uniform(0, 2 * np.pi)
-            if stable:
-                mag_u = sqrt_coef * np.power(i ** 2, (d - 4) / 2)
-                mag_v = sqrt_coef * np.power(i ** 2, (d - 4) / 2)
-            else:
-                mag_u = np.random.randn() * sqrt_coef * np.power(i ** 2, (d - 4) / 2)
-                mag_v = np.random.randn() * sqrt_coef * np.power(i ** 2, (d - 4) / 2)
-
-            value_u = np.complex(mag_u * np.cos(phase_u), mag_u * np.sin(phase_u))
-            value_v = np.complex(mag_v * np.cos(phase_v), mag_v * np.sin(phase_v))
-            fs_coef[i, 0] = value_u
-            fs_coef[n-i, 0] = np.conj(value_u)
-            fs_coef[0, i] = value_v
-            fs_coef[0, n-i] = np.conj(value_v)
-
-        surface = (np.fft.ifft2(fs_coef)).real
-        self.data.value = surface
-        self.data.interval = inter
+        # 频率索引u, v = 1..n/2-1处的幅值，由u^2+v^2的网格经广播一次算出
+        with span('Mv3dCreator.magnitude') as sp:
+            i_f = np.arange(1, n//2, dtype=float)
+            mag_axis = sqrt_coef * np.power(i_f**2, (d-4)/2)    # 坐标轴上(u, 0)和(0, v)处的幅值
+            mag = np.add.outer(i_f**2, i_f**2)
+            np.power(mag, (d-4)/2, out=mag)
+            mag *= sqrt_coef
+            sp.add_bytes(mag.nbytes)
+
+        return functools.partial(_surf_dft, n, mag, mag_axis, stable)
 
     def _get_fractal_cof_from_sq(self, n, d, sq):
         """ 由分形表面的Sq值计算表面的尺度系数C
@@ -137,21 +286,17 @@ class Mv3dCreator(object):
         :param d: 分形维数
         :param sq: 表面采样点高度均方根偏差的期望值
         """
-
-        temp_sum_1 = 0
-        for u in range(1, n // 2):
-            for v in range(0, n // 2):
-                temp_sum_1 = temp_sum_1 + np.power(u**2+v**2, d-4)
-
-        temp_sum_2 = 0
-        for u in range(0, n // 2):
-            for v in range(1, n // 2):
-                temp_sum_2 = temp_sum_2 + np.power(u**2+v**2, d-4)
-
-        c = (sq**2 * n**4) / (2 * temp_sum_1 + 2 * temp_sum_2)
+        # 两个求和项关于u、v对称，二者相等
+        temp_sum = _get_spectrum_power_sum(int(n), float(d))
+        c = (sq**2 * n**4) / (4 * temp_sum)
         return c
 
     def show_surface(self, surf, n, i):
+        # 绘图库只在显示表面时导入，建模和批量计算不依赖matplotlib
+        import matplotlib.pyplot as plt
+        from matplotlib import cm
+        from mpl_toolkits.mplot3d import Axes3D
+
         x = np.arange(0, n*i, i)
         y = np.arange(0, n*i, i)
         x, y = np.meshgrid(x, y)
@@ -161,6 +306,17 @@ class Mv3dCreator(object):
         ax.plot_surface(x, y, surf, rstride=1, cstride=1, cmap=cm.viridis)
         plt.show()
 
+    def save_data(self, fname):
+        """ 把当前表面数据保存为.npy文件及.json附属文件（采样间隔和生成参数）
+
+        :return: 实际写入的.npy文件名
+        """
+        return save_data(fname, self.data)
+
+    def load_data(self, fname, mmap_mode='r'):
+        """ 读取save_data保存的表面数据，默认以内存映射方式打开 """
+        self.data = load_data(fname, mmap_mode)
+
     def get_data(self):
         return self.data
 
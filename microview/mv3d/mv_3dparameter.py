@@ -1,41 +1,123 @@
 # -*- coding: utf-8 -*-
 import numpy as np
 from mv2d.mv_data2d import MvData2d
+from mv2d.mv_moments import amplitude_parameters
+from mv2d.mv_paracache import MvParaCache
+from mv2d.mv_fractal import surface_dimension
+from mv2d.mv_trace import traced
+from mv2d.mv_spatial import acf_2d, decay_lengths_2d, gradient_parameters_2d, texture_direction
 
 class Mv3dParameter(object):
+    # 参数名到（参数组，组内序号）的映射，每组参数由对应的_compute_<组名>一次算出
+    _GROUPS = {'Sq': ('amplitude', 0), 'Sa': ('amplitude', 1), 'Ssk': ('amplitude', 2), 'Sku': ('amplitude', 3),
+               'Sp': ('height', 0), 'Sv': ('height', 1), 'Sz': ('height', 2),
+               'Sdq': ('gradient', 0), 'Sdr': ('gradient', 1),
+               'Sal': ('acf', 0), 'Str': ('acf', 1), 'Std': ('texture', 0)}
 
     def __init__(self, data: MvData2d=None):
         self.data = data
-        self.para_dict = {}
+        self._cache = MvParaCache()  # 以数据版本为键的表征参数缓存
+
+    @property
+    def para_dict(self) -> dict:
+        """ 当前数据版本下已计算的表征参数，数据修改后自动清空
+        """
+        return self._cache.latest(self.data)
 
     def get_Sq(self, digits=4) -> float:
-        data_value = self.data.value
-        Sq = np.sqrt(np.mean(np.power(data_value, 2)))
-        Sq = np.round(Sq, digits)
-        self.para_dict.setdefault('Sq', Sq)
-        return Sq
+        return self.compute_all(digits)['Sq']
 
     def get_Sa(self, digits=4) -> float:
-        data_value = self.data.value
-        Sa = np.mean(np.abs(data_value))
-        Sa = np.round(Sa, digits)
-        self.para_dict.setdefault('Sa', Sa)
-        return Sa
+        return self.compute_all(digits)['Sa']
 
     def get_Ssk(self, digits=4) -> float:
-        data_value = self.data.value
-        Sq = self.get_Sq()
-        h3 = np.power(data_value, 3)
-        Ssk = np.mean(h3) / np.power(Sq, 3)
-        Ssk = np.round(Ssk, digits)
-        self.para_dict.setdefault('Ssk', Ssk)
-        return Ssk
+        return self.compute_all(digits)['Ssk']
 
     def get_Sku(self, digits=4) -> float:
-        data_value = self.data.value
-        Sq = self.get_Sq()
-        h4 = np.power(data_value, 4)
-        Sku = np.mean(h4) / np.power(Sq, 4)
-        Sku = np.round(Sku, digits)
-        self.para_dict.setdefault('SKu', Sku)
-        return Sku
+        return self.compute_all(digits)['Sku']
+
+    def get_Sp(self, digits=4) -> float:
+        return self.compute(['Sp'], digits)['Sp']
+
+    def get_Sv(self, digits=4) -> float:
+        return self.compute(['Sv'], digits)['Sv']
+
+    def get_Sz(self, digits=4) -> float:
+        return self.compute(['Sz'], digits)['Sz']
+
+    def get_Sdq(self, digits=4) -> float:
+        return self.compute(['Sdq'], digits)['Sdq']
+
+    def get_Sdr(self, digits=4) -> float:
+        return self.compute(['Sdr'], digits)['Sdr']
+
+    def get_Sal(self, digits=4) -> float:
+        return self.compute(['Sal'], digits)['Sal']
+
+    def get_Str(self, digits=4) -> float:
+        return self.compute(['Str'], digits)['Str']
+
+    def get_Std(self, digits=4) -> float:
+        return self.compute(['Std'], digits)['Std']
+
+    def get_fractal_dimension(self, method='psd', digits=4) -> float:
+        """ 估计表面的分形维数
+
+        立方体计数法（'box'）的估计值系统性地偏低，分形维数越大偏差越大，见mv_fractal.cube_dimension_2d。
+
+        :param method: 'psd'、'variogram'、'box'（立方体计数）或'roughness_length'，见mv2d.mv_fractal
+        :return: float 表面的分形维数
+        """
+        func = traced('Mv3dParameter.fractal.' + method, lambda: surface_dimension(self.data.value, method))
+        dim = self._cache.get(self.data, ('fractal', method), func)
+        paras = {'D': np.round(dim, digits)}
+        self._cache.update_latest(self.data, paras)
+        return paras['D']
+
+    def compute_all(self, digits=4) -> dict:
+        """ 一次遍历表面数据，计算全部幅度参数 Sq、Sa、Ssk、Sku
+
+        :return: dict 参数名到参数值的映射
+        """
+        return self.compute(['Sq', 'Sa', 'Ssk', 'Sku'], digits)
+
+    def compute(self, names, digits=4) -> dict:
+        """ 计算names中的表征参数，共用中间结果的参数（如Sal和Str、Sdq和Sdr）只计算一次
+
+        :param names: 参数名序列，可选'Sq'、'Sa'、'Ssk'、'Sku'、'Sp'、'Sv'、'Sz'、
+                      'Sdq'、'Sdr'（%）、'Sal'、'Str'、'Std'（度）
+        :return: dict 参数名到参数值的映射
+        """
+        paras = {}
+        for name in names:
+            if name not in self._GROUPS:
+                raise ValueError("未知的表征参数：{}".format(name))
+            group, idx = self._GROUPS[name]
+            # 未取整的参数值与digits无关，按组缓存
+            func = traced('Mv3dParameter.' + group, getattr(self, '_compute_' + group))
+            raw = self._cache.get(self.data, group, func)
+            paras[name] = np.round(raw[idx], digits)
+        self._cache.update_latest(self.data, paras)
+        return paras
+
+    def _compute_amplitude(self):
+        return amplitude_parameters(self.data.value)
+
+    def _compute_height(self):
+        sp = np.max(self.data.value)
+        sv = -np.min(self.data.value)
+        return sp, sv, sp + sv
+
+    def _compute_gradient(self):
+        return gradient_parameters_2d(self.data.value, self.data.interval)
+
+    def _compute_acf(self):
+        # Sal为各方向中最快的衰减距离，Str为最快与最慢衰减距离之比；各方向均未衰减时二者无定义
+        dist = decay_lengths_2d(acf_2d(self.data.value), self.data.interval)
+        sal = np.min(dist)
+        with np.errstate(invalid='ignore'):
+            s_tr = sal / np.max(dist)
+        return sal, s_tr
+
+    def _compute_texture(self):
+        return (texture_direction(self.data.value),)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+分块生成大尺寸分形表面，结果逐块写入内存映射的.npy文件
+
+内存中只保留当前处理的列块或行带，峰值内存由mem_budget控制，表面尺寸只受磁盘空间限制。
+给定随机数种子时，每一列（DFT法）或每一层的每一行（随机中点位移法）使用独立的随机数流，
+随机数与分块方式无关；零均值化和Sa缩放先逐行求和再对各行求和，求和顺序也与分块方式无关，
+因此生成结果与mem_budget无关。
+"""
+import os
+import numpy as np
+from mv2d.mv_datafile import npy_name
+from mv2d.mv_ensemble import draw_stacked, get_stream
+
+SURF_MEM_BUDGET = 256 * 2**20   # 分块生成表面时内存中数据块的默认上限（字节）
+
+
+def _get_rngs(seed, keys):
+    """ 每个key一个随机源；seed为None时均为全局随机状态 """
+    if seed is None:
+        return [np.random] * len(keys)
+    return [get_stream(seed, *key) for key in keys]
+
+
+def _dft_columns(n, d, sqrt_coef, stable, v_beg, v_end, seed):
+    """ 构造半平面傅里叶系数中第v_beg至v_end-1列（v = 0..n/2）
+
+    :return: 形状为(v_end-v_beg, n)的复数ndarray，每行为一列系数
+    """
+    m = n//2 - 1
+    col = np.zeros((v_end - v_beg, n), dtype=complex)
+    i_v = np.arange(v_beg, min(v_end, m + 1))    # 第n/2列的系数为0
+    if i_v.size == 0:
+        return col
+
+    rngs = _get_rngs(seed, [(v,) for v in i_v])
+    # 每列的随机相位：phase[:, u, 0]对应(u, v)，phase[:, u, 1]对应(u, n-v)，phase_axis对应(0, v)
+    phase = draw_stacked(rngs, 'uniform', 0, 2 * np.pi, size=(m, 2))
+    phase_axis = draw_stacked(rngs, 'uniform', 0, 2 * np.pi)
+
+    i_u = np.arange(0, n//2, dtype=float)
+    mag = np.add.outer(i_v.astype(float)**2, i_u**2)    # mag[:, u]为(u, v)处的幅值，u = 0..n/2-1
+    mag[mag == 0] = 1   # (0, 0)处的系数最后置为0
+    np.power(mag, (d-4)/2, out=mag)
+    mag *= sqrt_coef
+    mag1 = mag2 = mag[:, 1:]
+    mag_axis = mag[:, 0]
+    if not stable:
+        rnd = draw_stacked(rngs, 'standard_normal', size=(m, 2))
+        rnd_axis = draw_stacked(rngs, 'standard_normal')
+        mag1 = rnd[..., 0] * mag1
+        mag2 = rnd[..., 1] * mag2
+        mag_axis = rnd_axis * mag_axis
+
+    val = col[:i_v.size]
+    val[:, 1:n//2].real = mag1 * np.cos(phase[..., 0])
+    val[:, 1:n//2].imag = mag1 * np.sin(phase[..., 0])
+    val[:, n-1:n-1-m:-1].real = mag2 * np.cos(phase[..., 1])     # (n-u, v) = conj((u, n-v))
+    val[:, n-1:n-1-m:-1].imag = -mag2 * np.sin(phase[..., 1])
+    val[:, 0].real = mag_axis * np.cos(phase_axis)
+    val[:, 0].imag = mag_axis * np.sin(phase_axis)
+    if v_beg == 0:
+        # 第0列：(u, 0)与(n-u, 0)共轭，(0, 0)为0
+        val[0, n-1:n-1-m:-1] = np.conj(val[0, 1:n//2])
+        val[0, 0] = 0
+    return col
+
+
+def create_surf_dft_file(fname, n, d, sqrt_coef, stable=True, mem_budget=SURF_MEM_BUDGET, seed=None):
+    """ 用离散傅里叶逆变换法分块生成分形表面，写入.npy文件
+
+    二维实逆变换分两步完成：先按列块构造半平面系数并沿列做逆变换，结果暂存于磁盘；
+    再按行带读入，沿行做实逆变换后写入结果文件。
+
+    :param fname: 结果文件名，没有.npy扩展名时自动补足
+    :param n: 采样点数，数值应为2的幂次方
+    :param d: 分形维数，2<d<3
+    :param sqrt_coef: 尺度系数的平方根
+    :param stable: 是否生成平稳分形表面
+    :param mem_budget: 内存中数据块的上限（字节）
+    :param seed: 随机数种子，为None时使用全局随机状态
+    :return: 以读写方式打开的np.memmap，形状为(n, n)
+    """
+    nc = n//2 + 1
+    fname = npy_name(fname)
+    tmp_name = fname + '.spec.tmp'
+    spec = np.memmap(tmp_name, dtype=complex, mode='w+', shape=(n, nc))
+    try:
+        # 列变换：每列的系数、幅值、相位及逆变换结果约占 n*16*4 字节
+        col_blk = max(1, int(mem_budget) // (n * 64))
+        for v_beg in range(0, nc, col_blk):
+            v_end = min(v_beg + col_blk, nc)
+            col = _dft_columns(n, d, sqrt_coef, stable, v_beg, v_end, seed)
+            spec[:, v_beg:v_end] = np.fft.ifft(col, axis=1).T
+            del col
+        spec.flush()
+
+        # 行变换：每行的系数及结果约占 n*(16+8+8) 字节
+        surf = np.lib.format.open_memmap(fname, mode='w+', dtype=float, shape=(n, n))
+        row_blk = max(1, int(mem_budget) // (n * 32))
+        for r_beg in range(0, n, row_blk):
+            r_end = min(r_beg + row_blk, n)
+            surf[r_beg:r_end] = np.fft.irfft(spec[r_beg:r_end], n, axis=1)
+        surf.flush()
+    finally:
+        del spec
+        os.remove(tmp_name)
+    return surf
+
+
+def _rmd_diamond(work, n, stp, st_dev, band, lv, seed):
+    """ 随机中点位移法中一层的菱形步，按行带处理 """
+    m = n // stp
+    h = m // 2
+    for r_beg in range(0, m, band):
+        r_end = min(r_beg + band, m)
+        rows = np.array(work[r_beg*stp:r_end*stp+1:stp, ::stp])
+        ctr = rows[0:-1:2, 0:-1:2] + rows[2::2, 0:-1:2]
+        ctr += rows[0:-1:2, 2::2]
+        ctr += rows[2::2, 2::2]
+        ctr *= 0.25
+        rngs = _get_rngs(seed, [(lv, 0, r) for r in range(r_beg+1, r_end, 2)])
+        ctr += st_dev * draw_stacked(rngs, 'standard_normal', size=h)
+        work[(r_beg+1)*stp:r_end*stp:2*stp, stp::2*stp] = ctr
+
+
+def _rmd_square(work, n, stp, st_dev, band, lv, seed):
+    """ 随机中点位移法中一层的正方形步，按行带处理
+
+    本步只读取之前已确定的点，各行带之间互不依赖。
+    """
+    m = n // stp
+    for r_beg in range(0, m, band):
+        r_end = min(r_beg + band, m)
+        row_even = np.arange(r_beg, r_end + (1 if r_end == m else 0), 2)  # 本带中的偶数行
+        row_odd = np.arange(r_beg+1, r_end, 2)   # 本带中的奇数行
+        lo = max(r_beg - 1, 0)
+        hi = min(r_end + 1, m)
+        rows = np.array(work[lo*stp:hi*stp+1:stp, ::stp])
+
+        # 偶数行奇数列的点：左右两点加上下两个菱形中心，表面边界上只有三个相邻点
+        edge_r = rows[row_even-lo, 0:-1:2] + rows[row_even-lo, 2::2]
+        up = row_even > 0
+        edge_r[up] += rows[row_even[up]-1-lo, 1::2]
+        down = row_even < m
+        edge_r[down] += rows[row_even[down]+1-lo, 1::2]
+        edge_r /= (2 + up + down)[:, np.newaxis]
+
+        # 奇数行偶数列的点：上下两点加左右两个菱形中心
+        ctr = rows[row_odd-lo, 1::2]
+        edge_c = rows[row_odd-1-lo, 0::2] + rows[row_odd+1-lo, 0::2]
+        edge_c[:, 1:] += ctr
+        edge_c[:, :-1] += ctr
+        edge_c[:, 1:-1] *= 0.25
+        edge_c[:, [0, -1]] /= 3
+
+        rngs = _get_rngs(seed, [(lv, 1, r) for r in row_even])
+        edge_r += st_dev * draw_stacked(rngs, 'standard_normal', size=edge_r.shape[1])
+        rngs = _get_rngs(seed, [(lv, 1, r) for r in row_odd])
+        edge_c += st_dev * draw_stacked(rngs, 'standard_normal', size=edge_c.shape[1])
+
+        for i, r in enumerate(row_even):
+            work[r*stp, stp::2*stp] = edge_r[i]
+        work[row_odd[0]*stp:row_odd[-1]*stp+1:2*stp, ::2*stp] = edge_c
+
+
+def create_surf_rmd_file(fname, n, d, sa, mem_budget=SURF_MEM_BUDGET, seed=None):
+    """ 用随机中点位移法分块生成分形表面，写入.npy文件
+
+    (n+1)x(n+1)的工作网格存放于磁盘，每层的菱形步和正方形步按行带依次读入、计算并写回，
+    最后按行带完成零均值化和Sa缩放，写入n x n的结果文件。
+
+    :param fname: 结果文件名，没有.npy扩展名时自动补足
+    :param n: 采样点数，数值应为2的幂次方
+    :param d: 分形维数，2<d<3
+    :param sa: 构建表面的Sa值
+    :param mem_budget: 内存中数据块的上限（字节）
+    :param seed: 随机数种子，为None时使用全局随机状态
+    :return: 以读写方式打开的np.memmap，形状为(n, n)
+    """
+    assert n >= 2 and np.log2(n).is_integer(), "输入的采样点数不是2的幂次方，程序退出"
+    lev = int(np.log2(n))
+    hurst = 3 - d
+    st_dev = 1
+    stp = n // 2
+    fname = npy_name(fname)
+    tmp_name = fname + '.grid.tmp'
+    work = np.memmap(tmp_name, dtype=float, mode='w+', shape=(n+1, n+1))
+    try:
+        # 初始化四个角点的坐标值
+        corner = st_dev * draw_stacked(_get_rngs(seed, [()]), 'standard_normal', size=4)[0]
+        work[0, 0], work[0, n], work[n, 0], work[n, n] = corner
+
+        for lv in range(lev):
+            st_dev = st_dev * np.power(0.5, 0.5*hurst)
+            # 每行带约需 (行数+2)*(n/stp+1)*8*3 字节，行数取偶数
+            band = max(2, int(mem_budget) // ((n // stp + 1) * 24) // 2 * 2)
+            _rmd_diamond(work, n, stp, st_dev, band, lv, seed)
+            _rmd_square(work, n, stp, st_dev, band, lv, seed)
+            stp = stp // 2
+        work.flush()
+
+        # 使表面的平均高度为0，并按Sa缩放；先求各行之和，再对各行之和求和，结果与行带的划分无关
+        band = max(1, int(mem_budget) // (n * 24))
+        row_sum = np.empty(n)
+        for r_beg in range(0, n, band):
+            r_end = min(r_beg + band, n)
+            row_sum[r_beg:r_end] = np.sum(work[r_beg:r_end, 0:n], axis=1)
+        h_mean = np.sum(row_sum) / n**2
+        for r_beg in range(0, n, band):
+            r_end = min(r_beg + band, n)
+            row_sum[r_beg:r_end] = np.sum(np.abs(work[r_beg:r_end, 0:n] - h_mean), axis=1)
+        sa_surf = np.round(np.sum(row_sum) / n**2, 4)
+        ratio = np.round(sa, 4) / sa_surf
+
+        surf = np.lib.format.open_memmap(fname, mode='w+', dtype=float, shape=(n, n))
+        for r_beg in range(0, n, band):
+            r_end = min(r_beg + band, n)
+            surf[r_beg:r_end] = (work[r_beg:r_end, 0:n] - h_mean) * ratio
+        surf.flush()
+    finally:
+        del work
+        os.remove(tmp_name)
+    return surf
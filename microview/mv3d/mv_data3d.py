@@ -11,32 +11,10 @@ e-mail: zandz1978@126.com
 last edited:
 """
 import numpy as np
+from mv2d.mv_data2d import MvData2d
 
-
-class MvData(object):
-    """ 自定义的数据类型
-    """
-    def __init__(self, value=None, interval=1.0):
-        self.__value = value        # ndarray，存储数据
-        self.__interval = interval  # float, 采样间隔
-
-    @property
-    def interval(self):
-        return self.__interval
-
-    @interval.setter
-    def interval(self, interval):
-        if interval <= 0:
-            raise ValueError("采样间隔值必须大于0")
-        self.__interval = interval
-
-    @property
-    def value(self):
-        return self.__value
-
-    @value.setter
-    def value(self, value):
-        self.__value = value
+# 轮廓和表面使用同一数据类型，MvData保留为MvData2d的别名
+MvData = MvData2d
 
 
 if __name__ == "__main__":
@@ -2,19 +2,39 @@
 import sys
 import numpy as np
 from PySide2 import QtWidgets
-from PySide2.QtCore import QRegExp
+from PySide2.QtCore import QRegExp, QTimer
 from PySide2.QtGui import QRegExpValidator
 from PySide2.QtWidgets import *
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5 import NavigationToolbar2QT as NavigationToolbar
-import matplotlib.pyplot as plt
-from matplotlib import cm
-from mpl_toolkits.mplot3d import Axes3D
+from matplotlib.figure import Figure
+from matplotlib import cm, colors
+from mpl_toolkits.mplot3d import Axes3D     # 注册'3d'投影
 import matplotlib
 
+from mv2d import mv_trace
 from mv2d.mv_data2d import MvData2d
+from mv2d.mv_datafile import load_data, save_data
+from mv2d.mv_progress import sub_progress
+from mv2d.mv_worker import MvJobRunner
 from mv3d.mv_3dcreator import Mv3dCreator
 from mv3d.mv_3dparameter import Mv3dParameter
+from mv3d.mv_pyramid import MvPyramid, grid_coords, hillshade
+
+FACET_PIXELS = 8            # 三维显示时每个面片在画布上约占的像素数
+DETAIL_FACET_PIXELS = 3     # 显示表面细节时每个面片约占的像素数
+RELIEF_BRIGHTNESS = 0.4     # 晕渲图中背光处的亮度
+
+
+def _surface_facets(x, y, z):
+    """ 由网格坐标和高度构造四边形面片，顶点顺序与Axes3D.plot_surface（rstride=cstride=1）相同
+
+    :param x, y, z: 形状相同的二维ndarray
+    :return: (形状为(面片数, 4, 3)的顶点数组, 各面片顶点的平均高度)
+    """
+    pts = np.stack([x, y, z], axis=-1)
+    verts = np.stack([pts[:-1, :-1], pts[:-1, 1:], pts[1:, 1:], pts[1:, :-1]], axis=2).reshape(-1, 4, 3)
+    return verts, verts[..., 2].mean(axis=1)
 
 
 class MvFractalSurfaceGui(QMainWindow):
@@ -24,6 +44,18 @@ class MvFractalSurfaceGui(QMainWindow):
         self.method = "离散傅里叶逆变换"
         # self.b_equal_axis = False     目前matplotlib暂不支持三维表面的等比例坐标轴显示
         self.b_detail = False
+        self.b_relief = False
+        self._pyramid = None        # 当前表面的多分辨率金字塔，表面改变后重建
+        self._lod_key = None        # 当前显示的层和窗口
+        self._artist = None         # 三维表面（Poly3DCollection）或晕渲图（AxesImage），重绘时只更新其数据
+        self._trace_since = None    # 当前任务开始的时间，用于状态栏显示各阶段耗时
+
+        # 建模和参数计算在后台线程中进行，结果交回界面线程后绘图
+        self.runner = MvJobRunner(self)
+        self.runner.progress.connect(self._on_job_progress)
+        self.runner.finished.connect(self._on_surface_ready)
+        self.runner.failed.connect(self._on_job_failed)
+        self.runner.cancelled.connect(self._on_job_cancelled)
 
         self._init_ui()
 
@@ -34,6 +66,8 @@ class MvFractalSurfaceGui(QMainWindow):
         # self.setWindowIcon()
         self.status = self.statusBar()
         self.status.showMessage("分形表面建模及表征参数计算", 10000)
+        self._set_menu()
+        self._set_progress()
 
         self.glb_layout = QHBoxLayout()  # 全局布局
         self.left_layout = QVBoxLayout()  # 左侧布局
@@ -52,12 +86,66 @@ class MvFractalSurfaceGui(QMainWindow):
         self._set_button()
         self._set_show_para()
 
-        self._create_surface()
+        # 初始表面在事件循环开始、窗口显示之后再生成和绘制
+        QTimer.singleShot(0, self._create_surface)
+
+    def _set_menu(self):
+        tool_menu = self.menuBar().addMenu("工具")
+        self.act_trace = QAction("性能跟踪", self)
+        self.act_trace.setCheckable(True)
+        self.act_trace.setStatusTip("记录建模、参数计算和绘图各阶段的耗时，显示在状态栏")
+        self.act_trace.toggled.connect(mv_trace.enable)
+        act_export = QAction("导出跟踪...", self)
+        act_export.setStatusTip("把记录的各阶段耗时导出为Chrome跟踪格式的json文件")
+        act_export.triggered.connect(self._export_trace)
+        tool_menu.addAction(self.act_trace)
+        tool_menu.addAction(act_export)
+
+    def _set_progress(self):
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setMaximumWidth(160)
+        self.btn_cancel = QPushButton("取消")
+        self.btn_cancel.setToolTip("取消正在进行的建模")
+        self.btn_cancel.clicked.connect(self.runner.cancel)
+        self.status.addPermanentWidget(self.progress_bar)
+        self.status.addPermanentWidget(self.btn_cancel)
+        self._set_busy(False)
+
+    def _set_busy(self, busy):
+        self.progress_bar.setVisible(busy)
+        self.btn_cancel.setVisible(busy)
+        if busy:
+            self.progress_bar.setValue(0)
+
+    def _on_job_progress(self, fraction, stage):
+        self.progress_bar.setValue(int(100 * fraction))
+        self.status.showMessage(stage)
+
+    def _on_job_failed(self, message):
+        self._set_busy(False)
+        QMessageBox.warning(self, "警告", "建模失败：{}".format(message))
+
+    def _on_job_cancelled(self):
+        self._set_busy(False)
+        self.status.showMessage("已取消建模", 5000)
+
+    def _export_trace(self):
+        fname, ftype = QFileDialog.getSaveFileName(self, "保存文件", ".", "Chrome Trace Files (*.json)")
+        if not fname:
+            return
+        count = mv_trace.export_chrome_trace(fname)
+        QMessageBox.information(self, "信息", "导出了{}个跟踪事件".format(count))
+
+    def _show_trace(self, since):
+        """ 在状态栏显示since之后各阶段的耗时 """
+        if mv_trace.is_enabled():
+            self.status.showMessage(mv_trace.format_summary(mv_trace.events(since)))
 
     def _set_matplot_layout(self):
-        self.figure = plt.figure()
+        self.figure = Figure()      # 不经过pyplot，避免加载其全局状态和后端选择
         self.canvas = FigureCanvas(self.figure)
-        self.ax = Axes3D(self.figure)
+        self.ax = self.figure.add_subplot(111, projection='3d')
         matplotlib.rcParams["font.family"] = "STSong"
 
         self.toolbar = NavigationToolbar(self.canvas, self.c_widget)
@@ -66,11 +154,18 @@ class MvFractalSurfaceGui(QMainWindow):
         # self.cbx_equal.stateChanged.connect(lambda: self._equal_state())
         self.cbx_detail = QCheckBox("显示表面细节")
         self.cbx_detail.stateChanged.connect(lambda: self._show_detail())
+        self.cbx_relief = QCheckBox("平面晕渲预览")
+        self.cbx_relief.stateChanged.connect(lambda: self._show_relief())
+        # 平移、缩放结束后按新的显示范围选取金字塔的层
+        self.canvas.mpl_connect('button_release_event', lambda event: self._update_lod())
 
         self.left_layout.addWidget(self.canvas)
         # self.left_layout.addWidget(self.cbx_equal)
         # 目前Axes3D尚不支持等比例坐标
-        self.left_layout.addWidget(self.cbx_detail)
+        view_layout = QHBoxLayout()
+        view_layout.addWidget(self.cbx_detail)
+        view_layout.addWidget(self.cbx_relief)
+        self.left_layout.addLayout(view_layout)
         self.left_layout.addWidget(self.toolbar)
 
     def _equal_state(self):
@@ -79,6 +174,16 @@ class MvFractalSurfaceGui(QMainWindow):
 
     def _show_detail(self):
         self.b_detail = self.cbx_detail.isChecked()
+        self._redraw(keep_view=True)
+
+    def _show_relief(self):
+        self.b_relief = self.cbx_relief.isChecked()
+        self.figure.delaxes(self.ax)
+        self._artist = None
+        if self.b_relief:
+            self.ax = self.figure.add_subplot(111)
+        else:
+            self.ax = self.figure.add_subplot(111, projection='3d')
         self._redraw()
 
     def _set_model_method(self):
@@ -156,12 +261,50 @@ class MvFractalSurfaceGui(QMainWindow):
         self.right_layout.addWidget(para_group)
 
     def _set_button(self):
+        func_btn_layout = QHBoxLayout()
+
         self.btn_draw = QPushButton("绘图")
         self.btn_draw.setToolTip("单击开始绘图")
         self.btn_draw.setDefault(True)
-        self.right_layout.addWidget(self.btn_draw)
         self.btn_draw.clicked.connect(self._create_surface)
 
+        self.btn_export = QPushButton("导出...")
+        self.btn_export.setToolTip("单击导出表面数据")
+        self.btn_export.clicked.connect(self._export_surface_data)
+
+        self.btn_import = QPushButton("导入...")
+        self.btn_import.setToolTip("单击导入表面数据")
+        self.btn_import.clicked.connect(self._import_surface_data)
+
+        func_btn_layout.addWidget(self.btn_draw)
+        func_btn_layout.addWidget(self.btn_export)
+        func_btn_layout.addWidget(self.btn_import)
+        self.right_layout.addLayout(func_btn_layout)
+
+    def _export_surface_data(self):
+        if self.data.value is None:
+            QMessageBox.warning(self, "警告", "没有可导出的数据，请先建模或导入数据")
+            return
+        fname, ftype = QFileDialog.getSaveFileName(self, "保存文件", ".", "MicroView Files (*.npy)")
+        if not fname:
+            return
+        save_data(fname, self.data)
+        QMessageBox.information(self, "信息", "完成数据导出")
+
+    def _import_surface_data(self):
+        fname, ftype = QFileDialog.getOpenFileName(self, "打开文件", ".", "MicroView Files (*.npy)")
+        if not fname:
+            return
+        data = load_data(fname)
+        if data.ndim != 2:
+            QMessageBox.warning(self, "警告", "文件中的数据不是表面数据")
+            return
+        self.data = data
+        since = mv_trace.now()
+        self._redraw()
+        self._show_paras()
+        self._show_trace(since)
+
     def _set_show_para(self):
         self.table_widget = QTableWidget()
         self.table_widget.setRowCount(4)
@@ -181,56 +324,139 @@ class MvFractalSurfaceGui(QMainWindow):
         self.table_widget.setItem(3, 0, item_1)
 
     def _create_surface(self):
-        sc = Mv3dCreator()
+        """ 在后台线程中建模并计算参数，再次单击时取代尚未完成的建模 """
         dim = float(self.edt_dim.text())
         sqa = float(self.edt_sq.text())
         num = int(self.cbx_num.currentText().split('x')[0])
         si = float(self.edt_inter.text())
-        if self.method == "离散傅里叶逆变换":
-            stable = self.chx_stable.isChecked()
-            sc.create_surf_dft(num, dim, sqa, si, stable)
-        elif self.method == "随机中点位移法":
-            sc.create_surf_rmd(num, dim, sqa, si)
-
-        self.data = sc.get_data()
+        method = self.method
+        stable = self.chx_stable.isChecked()
+
+        def job(progress):
+            sc = Mv3dCreator()
+            gen_progress = sub_progress(progress, 0.0, 0.8)
+            if method == "离散傅里叶逆变换":
+                sc.create_surf_dft(num, dim, sqa, si, stable, progress=gen_progress)
+            elif method == "随机中点位移法":
+                sc.create_surf_rmd(num, dim, sqa, si, progress=gen_progress)
+            progress(0.8, "计算表征参数")
+            data = sc.get_data()
+            return data, Mv3dParameter(data).compute_all()
+
+        self._trace_since = mv_trace.now()
+        self._set_busy(True)
+        self.runner.submit(job)
+
+    def _on_surface_ready(self, result):
+        self.data, paras = result
+        self._on_job_progress(0.95, "绘制表面")
         self._redraw()
-
-        paras = Mv3dParameter(self.data)
-        sq = paras.get_Sq()
-        item = QTableWidgetItem(str(sq))
-        self.table_widget.setItem(0, 1, item)
-
-        sa = paras.get_Sa()
-        item = QTableWidgetItem(str(sa))
-        self.table_widget.setItem(1, 1, item)
-
-        ssk = paras.get_Ssk()
-        item = QTableWidgetItem(str(ssk))
-        self.table_widget.setItem(2, 1, item)
-
-        sku = paras.get_Sku()
-        item = QTableWidgetItem(str(sku))
-        self.table_widget.setItem(3, 1, item)
-
-    def _redraw(self):
-        nx, ny = self.data.value.shape
-        si = self.data.interval
-        x = np.arange(0, nx*si, si)
-        y = np.arange(0, ny*si, si)
-        x, y = np.meshgrid(x, y)
-
-        if self.b_detail or nx < 64:
-            rst = 1
-            cst = 1
+        self._show_paras(paras)
+        self._set_busy(False)
+        self.status.clearMessage()
+        self._show_trace(self._trace_since)
+
+    def _show_paras(self, paras=None):
+        if paras is None:
+            paras = Mv3dParameter(self.data).compute_all()
+        for row, name in enumerate(['Sq', 'Sa', 'Ssk', 'Sku']):
+            item = QTableWidgetItem(str(paras[name]))
+            self.table_widget.setItem(row, 1, item)
+
+    def _redraw(self, keep_view=False):
+        """ 按当前显示方式绘制表面
+
+        :param keep_view: 是否保持当前的视角和显示范围，为False时显示整个表面
+        """
+        if self._pyramid is None or not self._pyramid.is_valid(self.data):
+            with mv_trace.span('MvFractalSurfaceGui.pyramid'):
+                self._pyramid = MvPyramid(self.data)
+
+        if self.b_relief:
+            self._draw_relief(keep_view)
         else:
-            rst = nx // 64
-            cst = ny // 64
+            self._draw_surface(keep_view)
 
-        self.ax.cla()
-        self.ax.plot_surface(x, y, self.data.value, rstride=rst,
-                             cstride=cst, cmap=cm.gist_earth, shade=False)
+        with mv_trace.span('MvFractalSurfaceGui.canvas_draw'):
+            self.canvas.draw()
 
-        self.canvas.draw()
+    def _view(self, keep_view):
+        """ 按画布大小和显示范围从金字塔中选取层和窗口，返回值同MvPyramid.view """
+        width, height = self.canvas.get_width_height()
+        if self.b_relief:
+            side = max(width, height)   # 晕渲图每个像素约一个点
+        else:
+            side = max(width, height) // (DETAIL_FACET_PIXELS if self.b_detail else FACET_PIXELS)
+        if keep_view:
+            return self._pyramid.view(side, self.ax.get_xlim(), self.ax.get_ylim())
+        return self._pyramid.view(side)
+
+    def _update_lod(self):
+        """ 显示范围改变后，所需的层或窗口不同时重新绘制 """
+        if self._pyramid is None or not self._pyramid.is_valid(self.data):
+            return
+        level, z, x, y = self._view(True)
+        if (level, x[0], x[-1], y[0], y[-1]) != self._lod_key:
+            self._redraw(keep_view=True)
+
+    def _draw_surface(self, keep_view):
+        level, z, x, y = self._view(keep_view)
+        self._lod_key = (level, x[0], x[-1], y[0], y[-1])
+        with mv_trace.span('MvFractalSurfaceGui.meshgrid'):
+            x, y = grid_coords(x[0], x.size, y[0], y.size, self._pyramid.interval * 2**level)
+
+        with mv_trace.span('MvFractalSurfaceGui.plot_surface') as sp:
+            # 颜色和z轴范围取整个表面的高度范围，不随所选的层变化
+            z_min, z_max = self._pyramid.z_range
+            if self._artist is None:
+                self._artist = self.ax.plot_surface(x, y, z, rstride=1, cstride=1, cmap=cm.gist_earth,
+                                                    shade=False, vmin=z_min, vmax=z_max)
+            else:
+                # 保留坐标轴和视角，只替换面片的顶点和颜色
+                verts, z_avg = _surface_facets(x, y, z)
+                sp.add_bytes(verts.nbytes)
+                self._artist.set_verts(verts)
+                self._artist.set_array(z_avg)
+                self._artist.set_clim(z_min, z_max)
+            self.ax.set_zlim(z_min, z_max)
+            if not keep_view:
+                x0, x1, y0, y1 = self._pyramid.extent
+                self.ax.set_xlim(x0, x1)
+                self.ax.set_ylim(y0, y1)
+
+    def _draw_relief(self, keep_view):
+        """ 由金字塔中的一层直接生成带晕渲的高度图 """
+        level, z, x, y = self._view(keep_view)
+        self._lod_key = (level, x[0], x[-1], y[0], y[-1])
+        with mv_trace.span('MvFractalSurfaceGui.hillshade') as sp:
+            step = self._pyramid.interval * 2**level
+            shade = hillshade(z, step)
+            rgb = cm.gist_earth(colors.Normalize(*self._pyramid.z_range)(z))[..., :3]
+            rgb *= RELIEF_BRIGHTNESS + (1 - RELIEF_BRIGHTNESS) * shade[..., np.newaxis]
+            sp.add_bytes(rgb.nbytes + shade.nbytes)
+
+        with mv_trace.span('MvFractalSurfaceGui.imshow'):
+            extent = (x[0] - step/2, x[-1] + step/2, y[0] - step/2, y[-1] + step/2)
+            lims = (self.ax.get_xlim(), self.ax.get_ylim())
+            if self._artist is None:
+                self._artist = self.ax.imshow(rgb, origin='lower', interpolation='nearest', extent=extent)
+            else:
+                self._artist.set_data(rgb)
+                self._artist.set_extent(extent)
+            if keep_view:
+                # set_extent会按新的范围重新缩放坐标轴，恢复缩放后的显示范围
+                self.ax.set_xlim(lims[0])
+                self.ax.set_ylim(lims[1])
+            else:
+                x0, x1, y0, y1 = self._pyramid.extent
+                self.ax.set_xlim(x0, x1)
+                self.ax.set_ylim(y0, y1)
+
+    def closeEvent(self, event):
+        # 等待后台任务在下一个检查点停止后再关闭窗口
+        self.runner.cancel()
+        self.runner.wait()
+        event.accept()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+表面数据的多分辨率金字塔和晕渲图
+
+第k层由第k-1层的2x2块求均值、最小值和最大值得到，每边点数减半，均值各层的总存储约为原数据的1/3，
+边长为奇数时最后一行（列）不计入下一层。显示时按画布的像素数和当前缩放范围选取层和窗口，
+绘制的面片数只与画布大小有关，与表面大小无关。
+"""
+import functools
+import numpy as np
+from mv2d.mv_data2d import sample_coords
+
+PYRAMID_MIN_SIDE = 16   # 最粗一层每边的最少点数
+
+
+def _reduce(z, ufunc):
+    """ 用二元ufunc合并每个2x2块的四个点，返回每边点数减半的ndarray """
+    h, w = z.shape[0] // 2, z.shape[1] // 2
+    out = ufunc(z[0:2*h:2, 0:2*w:2], z[1:2*h:2, 0:2*w:2])
+    ufunc(out, z[0:2*h:2, 1:2*w:2], out=out)
+    ufunc(out, z[1:2*h:2, 1:2*w:2], out=out)
+    return out
+
+
+class MvPyramid(object):
+    """ 表面数据的多分辨率金字塔，第0层为原数据
+    """
+    def __init__(self, data, min_side=PYRAMID_MIN_SIDE):
+        """ 构造函数
+
+        :param data: MvData2d，value为二维ndarray或np.memmap
+        :param min_side: 最粗一层每边的最少点数
+        """
+        self.data = data
+        self.version = data.version
+        self.interval = data.interval
+        z = data.value
+        self.means = [z]    # 各层的块均值
+        self.mins = [z]     # 各层的块最小值
+        self.maxs = [z]     # 各层的块最大值
+        while min(self.means[-1].shape) // 2 >= min_side:
+            self.means.append(_reduce(self.means[-1], np.add) * 0.25)
+            self.mins.append(_reduce(self.mins[-1], np.minimum))
+            self.maxs.append(_reduce(self.maxs[-1], np.maximum))
+        self.z_range = (float(np.min(self.mins[-1])), float(np.max(self.maxs[-1])))    # 高度范围
+
+    def is_valid(self, data) -> bool:
+        """ 金字塔是否对应data的当前版本 """
+        return data is self.data and data.version == self.version
+
+    @property
+    def extent(self):
+        """ 表面在x、y方向的范围(0, x_max, 0, y_max) """
+        rows, cols = self.data.shape
+        return 0.0, cols * self.interval, 0.0, rows * self.interval
+
+    def level_for(self, side) -> int:
+        """ 每边点数不超过side的最精细的层，没有这样的层时为最粗一层 """
+        for level, z in enumerate(self.means):
+            if max(z.shape) <= side:
+                return level
+        return len(self.means) - 1
+
+    def coords(self, level):
+        """ 第level层各块中心的坐标
+
+        :return: (x, y)，一维ndarray，分别对应列和行
+        """
+        step = float(self.interval * 2**level)
+        offset = float(self.interval * (2**level - 1) / 2)
+        rows, cols = self.means[level].shape
+        return sample_coords(cols, step, offset), sample_coords(rows, step, offset)
+
+    def view(self, side, x_lim=None, y_lim=None):
+        """ 选取显示范围内每边约side个点的层和窗口
+
+        缩放后显示范围变小，选用更精细的层，窗口外的数据不参与绘制。
+
+        :param side: 显示范围内每边的点数上限
+        :param x_lim: x方向的显示范围(min, max)，为None时为整个表面
+        :param y_lim: y方向的显示范围(min, max)，为None时为整个表面
+        :return: (层号, 窗口内的高度, 窗口内的x坐标, 窗口内的y坐标)
+        """
+        x0, x1, y0, y1 = self.extent
+        x_lim = (x0, x1) if x_lim is None else (max(min(x_lim), x0), min(max(x_lim), x1))
+        y_lim = (y0, y1) if y_lim is None else (max(min(y_lim), y0), min(max(y_lim), y1))
+        frac = max((x_lim[1] - x_lim[0]) / (x1 - x0), (y_lim[1] - y_lim[0]) / (y1 - y0), 1e-6)
+        level = self.level_for(side / frac)
+
+        # 窗口向外多取一个点，使窗口边缘的面片覆盖显示范围
+        x, y = self.coords(level)
+        step = self.interval * 2**level
+        cols = np.nonzero((x >= x_lim[0] - step) & (x <= x_lim[1] + step))[0]
+        rows = np.nonzero((y >= y_lim[0] - step) & (y <= y_lim[1] + step))[0]
+        if cols.size < 2 or rows.size < 2:
+            cols = np.arange(x.size)
+            rows = np.arange(y.size)
+        c_sl = slice(cols[0], cols[-1] + 1)
+        r_sl = slice(rows[0], rows[-1] + 1)
+        return level, np.asarray(self.means[level][r_sl, c_sl]), x[c_sl], y[r_sl]
+
+
+@functools.lru_cache(maxsize=8)
+def grid_coords(x0, nx, y0, ny, step):
+    """ 起点为(x0, y0)、间隔为step的nx*ny网格坐标，形状均为(ny, nx)
+
+    相同的参数返回同一对只读ndarray，重复绘制同样大小的表面时不再重新生成meshgrid。
+    """
+    x, y = np.meshgrid(sample_coords(nx, step, x0), sample_coords(ny, step, y0))
+    x.setflags(write=False)
+    y.setflags(write=False)
+    return x, y
+
+
+def hillshade(z, interval=1.0, azimuth=315.0, altitude=45.0, exaggeration=1.0):
+    """ 计算表面的晕渲强度
+
+    :param z: 二维ndarray，表面高度
+    :param interval: 采样间隔
+    :param azimuth: 光源方位角（度），从y轴正方向顺时针计
+    :param altitude: 光源高度角（度）
+    :param exaggeration: 高度的夸大系数
+    :return: 与z形状相同的ndarray，取值在[0, 1]之间
+    """
+    dz_dy, dz_dx = np.gradient(np.asarray(z, dtype=float) * exaggeration, interval)
+    az = np.radians(azimuth)
+    alt = np.radians(altitude)
+    # 由坡度和坡向计算法向量与光源方向夹角的余弦
+    slope = np.arctan(np.hypot(dz_dx, dz_dy))
+    aspect = np.arctan2(-dz_dx, dz_dy)
+    shade = np.sin(alt) * np.cos(slope) + np.cos(alt) * np.sin(slope) * np.cos(az - aspect)
+    return np.clip(shade, 0.0, 1.0)
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+分形轮廓和表面的批量建模及表征参数计算（命令行，无图形界面）
+
+只导入numpy及建模、参数计算模块，不导入PySide2和matplotlib，可在无显示的服务器上运行。
+
+用法示例（在microview目录下）：
+    python mv_batch.py generate surface dft -n 256 -d 2.3 --scale 1 -k 100 --seed 1 -j 8 -o out
+    python mv_batch.py measure out/surface_dft.npy --params Sq Sa Sdq Sal --dimension psd -j 8
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+import numpy as np
+from mv2d.mv_2dcreator import Mv2dCreator
+from mv2d.mv_2dparameter import Mv2dParameter
+from mv2d.mv_data2d import MvData2d
+from mv2d.mv_datafile import load_data, save_meta
+from mv2d.mv_ensemble import ENSEMBLE_CHUNK_BYTES
+from mv3d.mv_3dcreator import Mv3dCreator
+from mv3d.mv_3dparameter import Mv3dParameter
+
+# 各建模算法的位置参数顺序，scale为Rq、尺度系数、标准差、Sq或Sa
+_CREATOR_ARGS = {
+    ('profile', 'wm'): lambda a: (a.n, a.d, a.scale, a.interval),
+    ('profile', 'dft'): lambda a: (a.n, a.d, a.scale, a.interval),
+    ('profile', 'mpd'): lambda a: (a.n, a.d, a.interval, a.scale),
+    ('surface', 'dft'): lambda a: (a.n, a.d, a.scale, a.interval),
+    ('surface', 'rmd'): lambda a: (a.n, a.d, a.scale, a.interval),
+}
+POWER_OF_TWO = {('profile', 'dft'), ('profile', 'mpd'), ('surface', 'rmd')}   # 采样点数须为2的幂次方的建模算法
+DEFAULT_PARAMS = {'profile': ['Rq', 'Ra', 'Rsk', 'Rku'], 'surface': ['Sq', 'Sa', 'Ssk', 'Sku']}
+MEASURE_TASK = 16   # 并行计算参数时每个任务的样本数
+
+_worker_state = {}  # 工作进程中打开的数据文件及计算设置
+
+
+def _member_paras(value, kind, interval, params, dimension, digits):
+    """ 计算一个样本的表征参数 """
+    data = MvData2d(value, interval)
+    para = Mv2dParameter(data) if kind == 'profile' else Mv3dParameter(data)
+    row = para.compute(params, digits)
+    if dimension:
+        row['D'] = para.get_fractal_dimension(dimension, digits)
+    return row
+
+
+def _init_worker(fname, kind, interval, params, dimension, digits):
+    _worker_state.update(value=np.load(fname, mmap_mode='r'), kind=kind, interval=interval,
+                         params=params, dimension=dimension, digits=digits)
+
+
+def _measure_task(bounds):
+    st = _worker_state
+    return [_member_paras(st['value'][i], st['kind'], st['interval'], st['params'], st['dimension'],
+                          st['digits']) for i in range(*bounds)]
+
+
+def _chunk_size(args):
+    """ 每次写入文件的样本数
+
+    未指定--chunk时，每个进程分得一个大小为ENSEMBLE_CHUNK_BYTES的任务，使-j个进程都参与每块的生成。
+    """
+    if args.chunk is not None:
+        return args.chunk
+    member_bytes = 8 * args.n ** (1 if args.kind == 'profile' else 2)
+    return max(1, ENSEMBLE_CHUNK_BYTES // member_bytes) * max(1, args.workers or 1)
+
+
+def generate(args):
+    """ 生成k个样本，逐块写入内存映射的.npy文件，并写入.json附属文件 """
+    key = (args.kind, args.method)
+    if key not in _CREATOR_ARGS:
+        raise ValueError("{}不支持建模算法：{}".format(args.kind, args.method))
+    if key in POWER_OF_TWO and (args.n < 2 or args.n & (args.n - 1)):
+        raise ValueError("建模算法{}的采样点数n必须为2的幂次方：{}".format(args.method, args.n))
+    creator = Mv2dCreator() if args.kind == 'profile' else Mv3dCreator()
+    seed = np.random.SeedSequence().entropy if args.seed is None else args.seed
+    os.makedirs(args.out, exist_ok=True)
+    fname = os.path.join(args.out, args.name or '{}_{}.npy'.format(args.kind, args.method))
+
+    out = None
+    i_beg = 0
+    for chunk in creator.create_ensemble(args.count, args.method, *_CREATOR_ARGS[key](args),
+                                         chunk_size=_chunk_size(args), seed=seed, workers=args.workers):
+        if out is None:
+            out = np.lib.format.open_memmap(fname, mode='w+', dtype=chunk.dtype,
+                                            shape=(args.count,) + chunk.shape[1:])
+        out[i_beg:i_beg + len(chunk)] = chunk
+        i_beg += len(chunk)
+    out.flush()
+    save_meta(fname, MvData2d(out, args.interval, method=args.method, d=args.d, target=args.scale,
+                              seed=seed, kind=args.kind, count=args.count))
+    del out
+    return fname
+
+
+def measure(fname, kind=None, params=None, dimension=None, digits=4, workers=None):
+    """ 计算数据文件中每个样本的表征参数
+
+    :param fname: .npy数据文件，可以是单个轮廓/表面，也可以是沿第0轴堆叠的一组样本
+    :param kind: 'profile'或'surface'，为None时由附属文件或数据维数确定
+    :return: (参数名列表, 每个样本一个dict的列表)
+    """
+    data = load_data(fname)
+    kind = kind or data.meta.get('kind') or ('profile' if data.ndim == 1 else 'surface')
+    params = params or DEFAULT_PARAMS[kind]
+    stacked = data.ndim == (2 if kind == 'profile' else 3)
+    if not stacked:
+        rows = [_member_paras(data.value, kind, data.interval, params, dimension, digits)]
+    else:
+        count = len(data)
+        bounds = [(i, min(i + MEASURE_TASK, count)) for i in range(0, count, MEASURE_TASK)]
+        init = (fname, kind, data.interval, params, dimension, digits)
+        if workers is None or workers <= 1 or len(bounds) == 1:
+            _init_worker(*init)
+            parts = map(_measure_task, bounds)
+            rows = [row for part in parts for row in part]
+        else:
+            import multiprocessing
+            with multiprocessing.Pool(min(workers, len(bounds)), initializer=_init_worker,
+                                      initargs=init) as pool:
+                rows = [row for part in pool.map(_measure_task, bounds, chunksize=1) for row in part]
+    names = list(params) + (['D'] if dimension else [])
+    return names, rows
+
+
+def write_tables(fname, names, rows):
+    """ 写出每个样本的参数表<fname>_params.csv和统计表<fname>_summary.csv
+
+    :return: 统计表的行，每行为(参数名, 均值, 标准差, 最小值, 最大值)
+    """
+    base = os.path.splitext(fname)[0]
+    with open(base + '_params.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['index'] + names)
+        for i, row in enumerate(rows):
+            writer.writerow([i] + [row[name] for name in names])
+
+    summary = []
+    for name in names:
+        col = np.array([row[name] for row in rows], dtype=float)
+        summary.append((name, np.mean(col), np.std(col), np.min(col), np.max(col)))
+    with open(base + '_summary.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['param', 'mean', 'std', 'min', 'max'])
+        writer.writerows(summary)
+    return summary
+
+
+def _print_summary(summary, out=sys.stdout):
+    out.write('{:<8}{:>12}{:>12}{:>12}{:>12}\n'.format('param', 'mean', 'std', 'min', 'max'))
+    for row in summary:
+        out.write('{:<8}{:>12.4g}{:>12.4g}{:>12.4g}{:>12.4g}\n'.format(*row))
+
+
+def _add_measure_args(parser):
+    parser.add_argument('--params', nargs='+', help="表征参数名，默认为全部幅度参数")
+    parser.add_argument('--dimension', choices=['psd', 'variogram', 'box', 'roughness_length'],
+                        help="同时估计分形维数所用的方法")
+    parser.add_argument('--digits', type=int, default=4, help="参数保留的小数位数")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="进程数")
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(prog='mv_batch', description="分形轮廓和表面的批量建模及表征参数计算")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    gen = sub.add_parser('generate', help="批量生成样本并计算表征参数")
+    gen.add_argument('kind', choices=['profile', 'surface'])
+    gen.add_argument('method', choices=['wm', 'dft', 'mpd', 'rmd'])
+    gen.add_argument('-n', type=int, required=True, help="采样点数")
+    gen.add_argument('-d', type=float, required=True, help="分形维数")
+    gen.add_argument('--scale', type=float, default=1.0,
+                     help="dft为Rq/Sq，wm为尺度系数，mpd为标准差，rmd为Sa")
+    gen.add_argument('--interval', type=float, default=1.0, help="采样间隔")
+    gen.add_argument('-k', '--count', type=int, default=1, help="样本数")
+    gen.add_argument('--seed', type=int, default=None, help="随机数种子，默认随机选取并记录在附属文件中")
+    gen.add_argument('--chunk', type=int, default=None,
+                     help="每次写入文件的样本数，默认为每个进程{} MB".format(ENSEMBLE_CHUNK_BYTES // 2**20))
+    gen.add_argument('-o', '--out', default='.', help="结果目录")
+    gen.add_argument('--name', default=None, help="结果文件名，默认为<kind>_<method>.npy")
+    gen.add_argument('--no-measure', action='store_true', help="只生成样本，不计算表征参数")
+    _add_measure_args(gen)
+
+    mea = sub.add_parser('measure', help="计算.npy数据文件中各样本的表征参数")
+    mea.add_argument('files', nargs='+')
+    mea.add_argument('--kind', choices=['profile', 'surface'], default=None)
+    _add_measure_args(mea)
+    return parser
+
+
+def main(argv=None):
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    try:
+        return _run(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+def _run(args):
+    if args.command == 'generate':
+        t_beg = time.perf_counter()
+        fname = generate(args)
+        print("已生成 {}（{:.2f} s）".format(fname, time.perf_counter() - t_beg))
+        files = [] if args.no_measure else [fname]
+        kind = args.kind
+    else:
+        files = args.files
+        kind = args.kind
+
+    for fname in files:
+        t_beg = time.perf_counter()
+        names, rows = measure(fname, kind, args.params, args.dimension, args.digits, args.workers)
+        summary = write_tables(fname, names, rows)
+        print("{}：{}个样本（{:.2f} s）".format(fname, len(rows), time.perf_counter() - t_beg))
+        _print_summary(summary)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())